@@ -0,0 +1,119 @@
+# MIT License
+
+# Copyright (c) 2020 Lauri P. Laux Jr
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#
+# Benchmark: compare-dnf package list parsing on a large `dnf list
+# installed` dump.
+#
+# Generates a synthetic file (1M lines by default) and reports time and
+# peak Python memory of the streaming parser against the previous
+# readlines() + dict implementation, kept here as the baseline.
+#
+
+import argparse
+import importlib.util
+import os
+import random
+import string
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ARCHES = ["x86_64", "noarch", "i686", "aarch64"]
+REPOS = ["@System", "@anaconda", "@updates", "@fedora", "@rpmfusion-free"]
+
+
+def load_compare_dnf():
+    # compare-dnf.py is not an importable module name
+    spec = importlib.util.spec_from_file_location("compare_dnf", os.path.join(ROOT, "compare-dnf.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def legacy_parse_fedora_packages(file_path):
+    with open(file_path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    packages = []
+    for line in lines:
+        line = line.strip()
+        if not line or line == "Pacotes instalados":
+            continue
+        parts = line.split()
+        if len(parts) >= 3:
+            packages.append({
+                "full_name": parts[0],
+                "name": parts[0].split(".")[0] if "." in parts[0] else parts[0],
+                "architecture": parts[0].split(".")[1] if "." in parts[0] else "noarch",
+                "version": parts[1],
+                "source": " ".join(parts[2:]),
+            })
+    return packages
+
+
+def build_fixture(path, lines, seed=42):
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Pacotes instalados\n")
+        for i in range(lines):
+            name = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 14))) + f"-{i}"
+            version = f"{rng.randint(0, 9)}.{rng.randint(0, 40)}.{rng.randint(0, 99)}-{rng.randint(1, 9)}.fc42"
+            f.write(f"{name}.{rng.choice(ARCHES)}  {version}  {rng.choice(REPOS)}\n")
+
+
+def measure(function, path):
+    # Timed and traced separately, tracemalloc slows allocation heavy code
+    start = time.perf_counter()
+    count = function(path)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compare-dnf parsers")
+    parser.add_argument("--lines", type=int, default=1_000_000, help="package lines in the fixture")
+    args = parser.parse_args()
+
+    compare_dnf = load_compare_dnf()
+    runs = {
+        "readlines + dict": lambda path: len(legacy_parse_fedora_packages(path)),
+        "streaming (count)": lambda path: sum(1 for _ in compare_dnf.parse_fedora_packages(path)),
+        "streaming (name set)": lambda path: len(set(p.name for p in compare_dnf.parse_fedora_packages(path))),
+    }
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "fedora-desktop-installed.txt")
+        build_fixture(path, args.lines)
+        size = os.path.getsize(path)
+        print(f"Fixture........: {args.lines} lines, {size / 1024 / 1024:.1f} Mb")
+        for name, function in runs.items():
+            count, elapsed, peak = measure(function, path)
+            print(f"{name:<22}: {elapsed:6.2f} s, peak {peak / 1024 / 1024:7.1f} Mb ({count} packages)")
+
+
+if __name__ == "__main__":
+    main()
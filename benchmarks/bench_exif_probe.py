@@ -0,0 +1,126 @@
+# MIT License
+
+# Copyright (c) 2020 Lauri P. Laux Jr
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#
+# Benchmark: header-only EXIF probe against the full exif.Image parse.
+#
+# Builds a synthetic corpus of JPEGs with and without an EXIF segment
+# and times how long each path takes to answer "has EXIF?" per file.
+#
+
+import argparse
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exif import Image
+from imageheaders import probe_exif
+
+
+def make_exif_segment(make, model):
+    """Little endian TIFF with an IFD0 holding Make and Model."""
+    make = make.encode("ascii") + b"\x00"
+    model = model.encode("ascii") + b"\x00"
+    entries = 2
+    data_offset = 8 + 2 + entries * 12 + 4
+    ifd = struct.pack("<H", entries)
+    ifd += struct.pack("<HHII", 0x010F, 2, len(make), data_offset)
+    ifd += struct.pack("<HHII", 0x0110, 2, len(model), data_offset + len(make))
+    ifd += struct.pack("<I", 0)
+    tiff = b"II*\x00" + struct.pack("<I", 8) + ifd + make + model
+    payload = b"Exif\x00\x00" + tiff
+    return b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+
+
+def make_jpeg(with_exif, payload_size, rng):
+    jfif = b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+    data = b"\xff\xd8"
+    data += b"\xff\xe0" + struct.pack(">H", len(jfif) + 2) + jfif
+    if with_exif:
+        data += make_exif_segment("Canon", "EOS 80D")
+    # Scan header followed by entropy coded noise (no 0xFF bytes)
+    sos = b"\x01\x01\x00\x00\x3f\x00"
+    data += b"\xff\xda" + struct.pack(">H", len(sos) + 2) + sos
+    data += rng.randbytes(payload_size).replace(b"\xff", b"\x00")
+    return data + b"\xff\xd9"
+
+
+def build_corpus(folder, count, payload_size, seed=42):
+    rng = random.Random(seed)
+    files = []
+    for i in range(count):
+        path = os.path.join(folder, "IMG_{:05d}.jpg".format(i))
+        with open(path, "wb") as f:
+            f.write(make_jpeg(i % 2 == 0, payload_size, rng))
+        files.append(path)
+    return files
+
+
+def full_parse(path):
+    with open(path, "rb") as image_file:
+        return Image(image_file).has_exif
+
+
+def probe(path):
+    return probe_exif(path).has_exif
+
+
+def time_it(function, files, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in files:
+            function(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark EXIF probe vs full exif parse")
+    parser.add_argument("--count", type=int, default=500, help="number of JPEGs in the corpus")
+    parser.add_argument("--payload", type=int, default=256 * 1024, help="bytes of image data per JPEG")
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        files = build_corpus(folder, args.count, args.payload)
+        for path in files:
+            if probe(path) != full_parse(path):
+                print(f"Mismatch between probe and full parse: {path}", file=sys.stderr)
+                sys.exit(1)
+        full = time_it(full_parse, files, args.repeat)
+        fast = time_it(probe, files, args.repeat)
+
+    print(f"Files..........: {args.count} ({args.payload // 1024} Kb payload, half with EXIF)")
+    print(f"exif.Image.....: {full / args.count * 1e6:10.1f} us/file")
+    print(f"probe_exif.....: {fast / args.count * 1e6:10.1f} us/file")
+    print(f"Speedup........: {full / fast:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
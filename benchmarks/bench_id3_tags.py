@@ -0,0 +1,117 @@
+# MIT License
+
+# Copyright (c) 2020 Lauri P. Laux Jr
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#
+# Benchmark: id3tags.read_tags against mp3_tagger.MP3File.get_tags.
+#
+# Generates a fixture set of MP3 files with ID3v2.3 and ID3v1 tags and
+# reports the per file latency of each reader.
+#
+
+import argparse
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from id3tags import available_backends, read_tags
+from mp3_tagger import MP3File
+
+
+def id3v2_frame(frame_id, text):
+    body = b"\x03" + text.encode("utf-8")
+    return frame_id + struct.pack(">I", len(body)) + b"\x00\x00" + body
+
+
+def id3v2_tag(title, track, artist, padding=1024):
+    frames = id3v2_frame(b"TIT2", title) + id3v2_frame(b"TRCK", track) + id3v2_frame(b"TPE1", artist)
+    frames += b"\x00" * padding
+    size = len(frames)
+    syncsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3\x03\x00\x00" + syncsafe + frames
+
+
+def id3v1_tag(title, track, artist):
+    field = lambda text, size: text.encode("latin-1", "replace")[:size].ljust(size, b"\x00")
+    return b"TAG" + field(title, 30) + field(artist, 30) + field("", 30) + b"2020" + field("", 28) + bytes([0, int(track), 0])
+
+
+def make_mp3(index, audio_size, rng):
+    title = "Song {}".format(index)
+    track = str(index % 20 + 1)
+    artist = "Artist {}".format(index % 50)
+    # Frame sync followed by noise stands in for the audio
+    audio = b"\xff\xfb\x90\x64" + rng.randbytes(audio_size)
+    return id3v2_tag(title, track, artist) + audio + id3v1_tag(title, track, artist)
+
+
+def build_fixtures(folder, count, audio_size, seed=42):
+    rng = random.Random(seed)
+    files = []
+    for i in range(count):
+        path = os.path.join(folder, "{:05d}.mp3".format(i))
+        with open(path, "wb") as f:
+            f.write(make_mp3(i, audio_size, rng))
+        files.append(path)
+    return files
+
+
+def mp3file_tags(path):
+    return MP3File(path).get_tags()
+
+
+def time_it(function, files, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in files:
+            function(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ID3 readers")
+    parser.add_argument("--count", type=int, default=500, help="number of MP3 files")
+    parser.add_argument("--audio", type=int, default=512 * 1024, help="bytes of audio per file")
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        files = build_fixtures(folder, args.count, args.audio)
+        results = {"MP3File.get_tags": time_it(mp3file_tags, files, args.repeat)}
+        for backend in available_backends():
+            results[f"read_tags({backend})"] = time_it(lambda path: read_tags(path, backend), files, args.repeat)
+
+    print(f"Files..........: {args.count} ({args.audio // 1024} Kb audio)")
+    baseline = results["MP3File.get_tags"]
+    for name, latency in results.items():
+        print(f"{name:<20}: {latency * 1e6:10.1f} us/file ({baseline / latency:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# MIT License
+
+# Copyright (c) 2020 Lauri P. Laux Jr
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#
+# Benchmark suite: times the hot paths of the scripts on the synthetic
+# corpora of corpus.py at one or more scales and saves the results as
+# JSON, so a run on one commit can be compared with a run on another.
+#
+#   python benchmarks/bench_suite.py --scale small --scale medium -o before.json
+#   git checkout other-branch
+#   python benchmarks/bench_suite.py --scale small --scale medium -o after.json --compare before.json
+#
+# Each case is run --repeat times on a warm page cache and the best time
+# is kept. Corpora are built in a temporary folder unless --corpus points
+# to one to keep between runs (a scale is only built when its folder is
+# missing).
+#
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import corpus
+from folderscan import scan_files
+
+JUNK_MAX_SIZE = 16 * 1024 # bytes, the corpus junk images are under it and camera ones over it
+REGRESSION = 1.10 # --compare flags cases at least this much slower...
+REGRESSION_FLOOR = 0.005 # ...and taking more than this many seconds, faster ones are mostly noise
+
+
+def load_script(file_name, module_name):
+    # Scripts like clean-mp3.py are not importable module names
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(ROOT, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def cases(files):
+    """
+    name -> (setup, run): setup() builds the input of the case once and
+    returns (input, number of items), run(input) is what gets timed
+    """
+    photojunkclean = load_script("photojunkclean.py", "photojunkclean")
+    folderwosub = load_script("folderwosub.py", "folderwosub")
+    clean_mp3 = load_script("clean-mp3.py", "clean_mp3")
+    pdforganized = load_script("pdforganized.py", "pdforganized")
+    compare_dnf = load_script("compare-dnf.py", "compare_dnf")
+    photos = os.path.commonpath(files["photos"])
+    music = os.path.commonpath(files["mp3s"])
+    jpegs = [path for path in files["photos"] if path.endswith(".jpg")]
+
+    def snapshots(kind, parse):
+        packages = [list(parse(path)) for path in files["snapshots"][kind]]
+        return packages, sum(map(len, packages))
+
+    return {
+        "findAllFolders": (lambda: (music, len(files["mp3s"])),
+            lambda folder: list(folderwosub.findAllFolders(folder))),
+        "getFilesFromFolder": (lambda: (photos, len(files["photos"])),
+            lambda folder: photojunkclean.getFilesFromFolder(folder, JUNK_MAX_SIZE)),
+        "fromCamera": (lambda: (jpegs, len(jpegs)),
+            lambda paths: [photojunkclean.fromCamera(path) for path in paths]),
+        "filter_duplicates": (lambda: (list(scan_files(music, [".mp3"])), len(files["mp3s"])),
+            clean_mp3.filter_duplicates),
+        "extract_information": (lambda: (files["pdfs"], len(files["pdfs"])),
+            lambda paths: [pdforganized.extract_information(path) for path in paths]),
+        "compare_package_lists": (lambda: snapshots("fedora", compare_dnf.parse_fedora_packages),
+            lambda packages: compare_dnf.compare_package_lists(*packages)),
+        "compare_package_lists (flatpak)": (lambda: snapshots("flatpak", compare_dnf.parse_flatpak_packages),
+            lambda packages: compare_dnf.compare_package_lists(*packages, field="app_id")),
+    }
+
+
+def measure(run, data, repeat):
+    best = None
+    # The scripts draw progress bars and print errors of the damaged files
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run(data)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_scale(folder, scale, repeat, only):
+    start = time.perf_counter()
+    files = corpus.load_corpus(folder, scale)
+    print(f"{scale}: corpus ready in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+    results = []
+    for name, (setup, run) in cases(files).items():
+        if only and name not in only:
+            continue
+        data, items = setup()
+        seconds = measure(run, data, repeat)
+        results.append({"case": name, "scale": scale, "items": items, "seconds": round(seconds, 6),
+            "us_per_item": round(seconds / items * 1e6, 3) if items else None})
+        print(f"{scale:<7} {name:<32}: {seconds:9.4f} s {items:>9} items", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline_path):
+    """ Print the time ratio of every case also in the baseline run, returns the regressed cases """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    before = {(result["case"], result["scale"]): result["seconds"] for result in baseline["results"]}
+    print(f"\nAgainst {baseline_path} (commit {baseline.get('commit')}):")
+    regressed = []
+    for result in results:
+        old = before.get((result["case"], result["scale"]))
+        if not old:
+            continue
+        ratio = result["seconds"] / old
+        slower = ratio >= REGRESSION and result["seconds"] > REGRESSION_FLOOR
+        print(f"{result['scale']:<7} {result['case']:<32}: {old:9.4f} -> {result['seconds']:9.4f} s ({ratio:5.2f}x)"
+            + ("  slower" if slower else ""))
+        if slower:
+            regressed.append(result)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scripts on synthetic corpora")
+    parser.add_argument("--scale", action="append", choices=list(corpus.SCALES),
+        help="corpus scale, repeat for several (default: small)")
+    parser.add_argument("--case", action="append", default=[], help="only run this case, repeat for several")
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs (default: 3)")
+    parser.add_argument("--corpus", default=None, help="folder to keep the corpora in (default: a temporary one)")
+    parser.add_argument("-o", "--output", default="benchmark-results.json", help="JSON results file")
+    parser.add_argument("--compare", default=None, metavar="PATH",
+        help="results of an earlier run to compare with, exits with 1 when a case got slower")
+    args = parser.parse_args()
+
+    results = []
+    with contextlib.ExitStack() as stack:
+        folder = args.corpus or stack.enter_context(tempfile.TemporaryDirectory())
+        for scale in args.scale or ["small"]:
+            results += run_scale(os.path.join(folder, scale), scale, args.repeat, set(args.case))
+    report = {"commit": git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+        "cpus": os.cpu_count(), "repeat": args.repeat, "results": results}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved: {args.output}")
+    if args.compare and compare(results, args.compare):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+# MIT License
+
+# Copyright (c) 2020 Lauri P. Laux Jr
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#
+# Deterministic synthetic corpora for the benchmark suite.
+#
+# Every builder takes a folder, a size and a seed and writes the same
+# bytes, names and mtimes on every run, so numbers taken on two commits
+# are measured against identical input:
+#
+#   build_photos     dated folder tree of JPEGs (with and without EXIF)
+#                    and PNGs, some of them screenshot sized
+#   build_mp3s       Genre/Artist/Album/track tree of MP3s with ID3v2 and ID3v1
+#                    tags, "(1)" copies and re-encodes of some songs
+#   build_pdfs       small and large PDFs, some encrypted, some with an
+#                    object stream or a damaged trailer
+#   build_snapshots  `dnf list installed` and `flatpak list` snapshots
+#                    of a baseline host and a drifted one
+#
+#   python benchmarks/corpus.py /tmp/corpus --scale medium
+#
+# The folder is reused when it already holds the corpus of that scale and
+# seed, and wiped and built again otherwise.
+#
+
+import argparse
+import json
+import os
+import random
+import shutil
+import string
+import struct
+import zlib
+
+MANIFEST = "corpus.json"
+FIXED_MTIME = 1_600_000_000 # 2020-09-13, every generated file gets it
+PHOTO_FOLDERS = ["Camera", "WhatsApp Images", "Screenshots", "Downloads", "Edited"]
+CAMERA_PAYLOAD = 48 * 1024 # bytes of image data of a camera JPEG
+JUNK_PAYLOAD = 6 * 1024 # bytes of image data of a junk JPEG or PNG
+MPEG_128K = b"\xff\xfb\x90\x00" # MPEG1 layer III, 128kbps, 44.1kHz, stereo
+MPEG_192K = b"\xff\xfb\xb0\x00" # same at 192kbps
+FRAME_SIZES = {MPEG_128K: 417, MPEG_192K: 626}
+GENRES = ["Rock", "Jazz", "Samba", "Electronic", "Classical"]
+ARCHES = ["x86_64", "noarch", "i686"]
+REPOS = ["@System", "@anaconda", "@updates", "@fedora", "@rpmfusion-free"]
+FLATPAK_ORIGINS = ["flathub", "fedora"]
+
+# Per scale: photos, MP3 songs, PDFs and snapshot lines
+SCALES = {
+    "small": {"photos": 300, "songs": 100, "pdfs": 30, "packages": 20_000},
+    "medium": {"photos": 3_000, "songs": 1_000, "pdfs": 300, "packages": 250_000},
+    "large": {"photos": 20_000, "songs": 4_000, "pdfs": 1_500, "packages": 2_000_000},
+}
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    os.utime(path, (FIXED_MTIME, FIXED_MTIME))
+    return path
+
+
+def noise(rng, size):
+    # Image and audio data never holds a 0xFF, so no marker or frame sync shows up in it
+    return rng.randbytes(size).replace(b"\xff", b"\x00")
+
+
+def exif_segment(make, model):
+    """ APP1 segment with a little endian TIFF holding Make and Model """
+    make = make.encode("ascii") + b"\x00"
+    model = model.encode("ascii") + b"\x00"
+    data_offset = 8 + 2 + 2 * 12 + 4
+    ifd = struct.pack("<H", 2)
+    ifd += struct.pack("<HHII", 0x010F, 2, len(make), data_offset)
+    ifd += struct.pack("<HHII", 0x0110, 2, len(model), data_offset + len(make))
+    ifd += struct.pack("<I", 0)
+    payload = b"Exif\x00\x00" + b"II*\x00" + struct.pack("<I", 8) + ifd + make + model
+    return b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+
+
+def make_jpeg(rng, width, height, payload, exif=None):
+    jfif = b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+    data = b"\xff\xd8" + b"\xff\xe0" + struct.pack(">H", len(jfif) + 2) + jfif
+    if exif:
+        data += exif_segment(*exif)
+    sof = struct.pack(">BHHB", 8, height, width, 3) + b"\x01\x22\x00\x02\x11\x01\x03\x11\x01"
+    data += b"\xff\xc0" + struct.pack(">H", len(sof) + 2) + sof
+    sos = b"\x03\x01\x00\x02\x11\x03\x11\x00\x3f\x00"
+    data += b"\xff\xda" + struct.pack(">H", len(sos) + 2) + sos
+    return data + noise(rng, payload) + b"\xff\xd9"
+
+
+def png_chunk(kind, body):
+    return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+
+
+def make_png(rng, width, height, payload):
+    header = png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+    return b"\x89PNG\r\n\x1a\n" + header + png_chunk(b"IDAT", noise(rng, payload)) + png_chunk(b"IEND", b"")
+
+
+def build_photos(folder, count, seed=1):
+    """
+    count images under folder/<year>/<month>/<album>/, returns their paths.
+    Out of every 10: 4 camera JPEGs with EXIF, 1 small JPEG with EXIF, 2
+    small JPEGs without EXIF, 1 screenshot PNG named like one, 1 PNG with
+    a phone screen size and 1 large PNG.
+    """
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        album = os.path.join(folder, str(2015 + i % 8), "{:02d}".format(1 + i // 8 % 12),
+            PHOTO_FOLDERS[i // 96 % len(PHOTO_FOLDERS)])
+        kind = i % 10
+        if kind < 4:
+            name, data = "IMG_{:06d}.jpg".format(i), make_jpeg(rng, 4000, 3000, CAMERA_PAYLOAD, ("Canon", "EOS 80D"))
+        elif kind == 4:
+            name, data = "IMG_{:06d}.jpg".format(i), make_jpeg(rng, 640, 480, JUNK_PAYLOAD, ("Apple", "iPhone 12"))
+        elif kind < 7:
+            name, data = "IMG-{:06d}-WA0001.jpg".format(i), make_jpeg(rng, 1600, 1200, JUNK_PAYLOAD)
+        elif kind == 7:
+            name, data = "Screenshot_{:06d}.png".format(i), make_png(rng, 1080, 2400, JUNK_PAYLOAD)
+        elif kind == 8:
+            name, data = "received_{:06d}.png".format(i), make_png(rng, 1170, 2532, CAMERA_PAYLOAD)
+        else:
+            name, data = "scan_{:06d}.png".format(i), make_png(rng, 2480, 3508, CAMERA_PAYLOAD)
+        paths.append(write_file(os.path.join(album, name), data))
+    return paths
+
+
+def id3v2_frame(frame_id, text):
+    body = b"\x03" + text.encode("utf-8")
+    return frame_id + struct.pack(">I", len(body)) + b"\x00\x00" + body
+
+
+def id3v2_tag(title, track, artist, padding):
+    frames = id3v2_frame(b"TIT2", title) + id3v2_frame(b"TRCK", track) + id3v2_frame(b"TPE1", artist)
+    frames += b"\x00" * padding
+    size = len(frames)
+    syncsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3\x03\x00\x00" + syncsafe + frames
+
+
+def id3v1_tag(title, track, artist):
+    field = lambda text, size: text.encode("latin-1", "replace")[:size].ljust(size, b"\x00")
+    return b"TAG" + field(title, 30) + field(artist, 30) + field("", 30) + b"2020" + field("", 28) + bytes([0, track, 0])
+
+
+def mpeg_audio(rng, header, frames):
+    size = FRAME_SIZES[header]
+    return b"".join(header + noise(rng, size - len(header)) for _ in range(frames))
+
+
+def build_mp3s(folder, count, seed=2):
+    """
+    count songs under folder/<genre>/<artist>/<album>/, returns the paths of all
+    files written. Every 5th song also gets a "(1)" copy with the same
+    audio and other tags, every 10th a 192kbps re-encode with the same
+    artist and title. Songs run from 40 to 400 frames (1 to 10 seconds),
+    so both the partial and the full hash paths of the duplicate finder
+    get exercised.
+    """
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        artist = "Artist {:03d}".format(i // 120)
+        album = os.path.join(folder, GENRES[i // 120 % len(GENRES)], artist, "Album {:02d}".format(i // 12 % 10))
+        title = "Song {:05d}".format(i)
+        track = 1 + i % 12
+        frames = rng.randint(40, 400)
+        state = rng.getstate()
+        audio = mpeg_audio(rng, MPEG_128K, frames)
+        name = "{:02d} - {}".format(track, title)
+        paths.append(write_file(os.path.join(album, name + ".mp3"),
+            id3v2_tag(title, str(track), artist, 512) + audio + id3v1_tag(title, track, artist)))
+        if i % 5 == 0:
+            # Retagged copy: bigger ID3v2 padding, no ID3v1
+            paths.append(write_file(os.path.join(album, name + " (1).mp3"),
+                id3v2_tag(title, "{}/12".format(track), artist, 2048) + audio))
+        if i % 10 == 0:
+            rng.setstate(state)
+            paths.append(write_file(os.path.join(album, name + " [192k].mp3"),
+                id3v2_tag(title, str(track), artist, 512) + mpeg_audio(rng, MPEG_192K, frames)))
+    return paths
+
+
+def pdf_string(text):
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def make_pdf(rng, title, author, pages, page_bytes, encrypted=False):
+    """ Classic xref table PDF with an Info dictionary and pages of text """
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+            " ".join("{} 0 R".format(5 + page * 2) for page in range(pages)), pages),
+        "<< /Title {} /Author {} /Creator (corpus.py) /Producer (corpus.py) /Subject {} >>".format(
+            pdf_string(title), pdf_string(author), pdf_string("Synthetic " + title)),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for page in range(pages):
+        words = " ".join(rng.choice(("lorem", "ipsum", "dolor", "sit", "amet", "data", "book")) for _ in range(12))
+        lines = [words] * max(1, page_bytes // 60)
+        text = "BT /F1 10 Tf 72 720 Td 12 TL {} ET".format(" ".join("{} '".format(pdf_string(line)) for line in lines))
+        objects.append("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            "/Resources << /Font << /F1 4 0 R >> >> /Contents {} 0 R >>".format(6 + page * 2))
+        objects.append("<< /Length {} >>\nstream\n{}\nendstream".format(len(text), text))
+    if encrypted:
+        objects.append("<< /Filter /Standard /V 1 /R 2 /O <{}> /U <{}> /P -44 >>".format(
+            rng.randbytes(32).hex(), rng.randbytes(32).hex()))
+    body = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    offsets = []
+    for number, content in enumerate(objects, 1):
+        offsets.append(len(body))
+        body += "{} 0 obj\n{}\nendobj\n".format(number, content).encode("latin-1")
+    xref = len(body)
+    body += "xref\n0 {}\n0000000000 65535 f \n".format(len(objects) + 1).encode("ascii")
+    body += "".join("{:010d} 00000 n \n".format(offset) for offset in offsets).encode("ascii")
+    trailer = "/Size {} /Root 1 0 R /Info 3 0 R".format(len(objects) + 1)
+    if encrypted:
+        file_id = rng.randbytes(16).hex()
+        trailer += " /Encrypt {} 0 R /ID [<{}> <{}>]".format(len(objects), file_id, file_id)
+    return body + "trailer\n<< {} >>\nstartxref\n{}\n%%EOF\n".format(trailer, xref).encode("ascii")
+
+
+def build_pdfs(folder, count, seed=3):
+    """
+    count PDFs under folder/<shelf>/, returns their paths. Out of every
+    10: 6 small (1-4 pages), 2 large (60-200 pages, about 4Kb each), 1
+    encrypted and 1 with a broken startxref offset that only a full
+    parse can read.
+    """
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        shelf = os.path.join(folder, "shelf-{:02d}".format(i // 50))
+        title = "Book {:05d}".format(i)
+        author = "Author {:03d}".format(i % 97)
+        kind = i % 10
+        if kind < 6:
+            data = make_pdf(rng, title, author, rng.randint(1, 4), 600)
+        elif kind < 8:
+            data = make_pdf(rng, title, author, rng.randint(60, 200), 4096)
+        elif kind == 8:
+            data = make_pdf(rng, title, author, rng.randint(1, 4), 600, encrypted=True)
+        else:
+            data = make_pdf(rng, title, author, rng.randint(1, 4), 600)
+            start = data.rindex(b"startxref\n") + len(b"startxref\n")
+            data = data[:start] + b"999999999" + data[data.index(b"\n", start):]
+        paths.append(write_file(os.path.join(shelf, "{}.pdf".format(title.replace(" ", "_"))), data))
+    return paths
+
+
+def package_name(rng, i):
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 12))) + "-" + str(i)
+
+
+def build_snapshots(folder, packages, seed=4):
+    """
+    Write a baseline and a drifted host snapshot of both kinds, returns
+    {"fedora": (baseline, drifted), "flatpak": (baseline, drifted)}. The
+    drifted host misses 2% of the packages, has 2% others and 5% at
+    another version. Flatpak snapshots get one line per 100 packages.
+    """
+    rng = random.Random(seed)
+    names = [package_name(rng, i) for i in range(packages)]
+    baseline, drifted = [], []
+    for i, name in enumerate(names):
+        line = "{}.{}  {}.{}.{}-{}.fc42  {}\n".format(name, rng.choice(ARCHES), rng.randint(0, 9),
+            rng.randint(0, 40), rng.randint(0, 99), rng.randint(1, 9), rng.choice(REPOS))
+        baseline.append(line)
+        roll = rng.random()
+        if roll < 0.02:
+            continue
+        if roll < 0.07:
+            line = line.replace(".fc42", ".1.fc42", 1)
+        drifted.append(line)
+    drifted += ["{}.x86_64  1.0.0-1.fc42  @updates\n".format(package_name(rng, packages + i)) for i in range(packages // 50)]
+    flatpaks = [("App {}".format(i), "org.example.App{}".format(i), "{}.{}".format(rng.randint(1, 9), rng.randint(0, 20)),
+        "stable", rng.choice(FLATPAK_ORIGINS)) for i in range(max(1, packages // 100))]
+    result = {"fedora": [], "flatpak": []}
+    for host, lines, apps in (("baseline", baseline, flatpaks), ("drifted", drifted, flatpaks[len(flatpaks) // 50:])):
+        fedora = os.path.join(folder, "{}-desktop-installed.txt".format(host))
+        write_file(fedora, ("Pacotes instalados\n" + "".join(lines)).encode("utf-8"))
+        flatpak = os.path.join(folder, "{}-flatpak-installed.txt".format(host))
+        write_file(flatpak, "".join("\t".join(app) + "\n" for app in apps).encode("utf-8"))
+        result["fedora"].append(fedora)
+        result["flatpak"].append(flatpak)
+    return {kind: tuple(files) for kind, files in result.items()}
+
+
+def build_corpus(folder, scale="small", seed=0):
+    """
+    All four corpora of a scale under folder, returns {name: paths}. The
+    paths are also saved to folder/corpus.json, written last, so
+    load_corpus() only reuses complete corpora.
+    """
+    sizes = SCALES[scale]
+    files = {
+        "photos": build_photos(os.path.join(folder, "photos"), sizes["photos"], seed + 1),
+        "mp3s": build_mp3s(os.path.join(folder, "mp3"), sizes["songs"], seed + 2),
+        "pdfs": build_pdfs(os.path.join(folder, "pdf"), sizes["pdfs"], seed + 3),
+        "snapshots": build_snapshots(os.path.join(folder, "dnf"), sizes["packages"], seed + 4),
+    }
+    with open(os.path.join(folder, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump({"scale": scale, "seed": seed, "files": files}, f)
+    return files
+
+
+def load_corpus(folder, scale="small", seed=0):
+    """ Paths of the corpus in folder, building it first when missing or of another scale or seed """
+    try:
+        with open(os.path.join(folder, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest["scale"] == scale and manifest["seed"] == seed:
+            return manifest["files"]
+    except (OSError, ValueError, KeyError):
+        pass
+    if os.path.isdir(folder):
+        shutil.rmtree(folder)
+    return build_corpus(folder, scale, seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic benchmark corpus")
+    parser.add_argument("folder", help="folder to write the corpus to")
+    parser.add_argument("--scale", choices=list(SCALES), default="small", help="corpus size (default: small)")
+    parser.add_argument("--seed", type=int, default=0, help="base random seed (default: 0)")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.folder, args.scale, args.seed)
+    for name, paths in corpus.items():
+        count = len(paths) if isinstance(paths, list) else sum(len(files) for files in paths.values())
+        print(f"{name:<10}: {count} files")
+
+
+if __name__ == "__main__":
+    main()
@@ -33,113 +33,303 @@
 #
 
 import click
+import instrument
 import os
-import shutil
 import json
+import hashlib
 import pathlib
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from folderscan import scan_files
+from id3tags import audio_bounds, available_backends, read_tags
+from moveengine import MoveEngine
+from mp3info import read_audio_info
 from progress.bar import Bar
 from progress.spinner import Spinner
-from mp3_tagger import MP3File, VERSION_1, VERSION_2, VERSION_BOTH
 
-class Duplicates:
+MOVE_FOLDER = "D:\\Work\\MP3-Duplicada"
+PARTIAL_HASH_SIZE = 64 * 1024 # bytes hashed at each end of the audio
+HASH_WORKERS = 8
+COPY_SUFFIXES = ["({})".format(i) for i in range(1, 9)] + ["_{}.".format(i) for i in range(1, 9)]
+DURATION_TOLERANCE = 2.0 # seconds apart two encodings of the same song may be
+MIN_AUDIO_SIZE = 24 # bytes, the smallest MPEG audio frame
 
-    def __init__(self):
-        self.total = 0
-
-    def onemore(self):
-        self.total = self.total + 1
+def moveFiles(fileList, toFolder):
+    engine = MoveEngine(toFolder)
+    with instrument.stats().stage("move"):
+        if engine.pending() > 0:
+            with Bar('Resuming interrupted move', max=engine.pending()) as bar:
+                engine.resume(progress=bar.next)
+        with Bar('Moving files', max=len(fileList)) as bar:
+            moved = engine.move([file["path"] for file in fileList], progress=bar.next)
+    instrument.stats().count("moved", len(moved))
+    instrument.stats().count("move_errors", len(engine.errors))
+    for path, error in engine.errors:
+        click.echo('Error moving file: {} ({})'.format(path, error))
 
-DUPLICATES = Duplicates()
+def undoMoves(toFolder, allRuns=False):
+    engine = MoveEngine(toFolder)
+    with Bar('Restoring files', max=engine.undoable(allRuns)) as bar:
+        restored = engine.undo(progress=bar.next, all_runs=allRuns)
+    for path, error in engine.errors:
+        click.echo('Error restoring file: {} ({})'.format(path, error))
+    return restored
 
-def findAllFolders(folder):
-    folders = []
-    folders.append(folder)
+def getFilesFromFolder(folder, types=[".mp3"], tagsBackend="id3", similar=False):
+    files = []
     spinner = Spinner()
     if os.path.isdir(folder):
-        for root, dirs, _ in os.walk(folder):
-            for folder in dirs:
-                fullpath = os.path.join(root, folder)
-                folders.append(fullpath)
-                spinner.message = "Analysing folders: "
-                spinner.next()
-    click.echo("\nFound {} folders.".format(len(folders)))
-    return folders
+        for entry in instrument.timed_iter(scan_files(folder, types), "scan"):
+            spinner.message = "Analysing folder: '{}' - Files: {} - ".format(folder, len(files))
+            spinner.next()
+            files.append(entry)
+        spinner.finish()
+    return filter_duplicates(files, tagsBackend, similar)
 
-def moveFiles(fileList, toFolder):
-    with Bar('Moving files', max=len(fileList)) as bar:
-        for file in fileList:
-            _, moveFileName = os.path.split(file["path"])
-            newFile = os.path.join(toFolder, moveFileName)
-            suffix = 0
-            while os.path.isfile(newFile):
-                _, name = os.path.split(newFile)
-                name, ext = os.path.splitext(name)
-                suffix += 1
-                newFile = os.path.join(toFolder, "{}-({}){}".format(name, suffix, ext))
-            shutil.move(file["path"], newFile)
-            bar.next()
+def filter_duplicates(files, tagsBackend="id3", similar=False):
+    """
+    Find files with the same audio content. Files are bucketed by the size
+    of their audio frames (ID3v1/v2 and APE tags excluded, so retagged copies
+    still match), then by a hash of the first and last 64Kb of audio and,
+    for what still collides, by a hash of the whole audio.
 
-def getFilesFromFolder(folder, types=[".mp3"]):
+    With similar, files with the same artist and title and about the same
+    duration are also taken as copies of one song, in other encodings.
+    Audio and tag groups sharing a file are merged into one group. Every
+    group keeps its best copy: highest bitrate, then longest, then the
+    name without a copy suffix, and the other files are its copies.
+    """
     fileList = []
-    iterations = 0
-    spinner = Spinner()
-    if os.path.isdir(folder):
-        for root, _, files in os.walk(folder):
-            if len(files) == 0:
-                break
-            for file in files:
-                iterations += 1
-                spinner.message = "Analysing folder: '{}' - Files: {} - Duplicates: {} - ".format(folder, iterations, DUPLICATES.total)
-                spinner.next()
-                path = os.path.join(root, file)
-                size = os.path.getsize(path)
-                extension = os.path.splitext(file)[-1]
-                filter_duplicates(extension, types, path, fileList, size)
-            spinner.clearln()
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS) as pool:
+        bounds = {}
+        with Bar('Reading tags', max=len(files)) as bar:
+            for entry, bound in zip(files, pool.map(instrument.timed(audioBoundsOrNone, "bounds"), files)):
+                bar.next()
+                bound = instrument.unwrap(bound)
+                # Tag only or truncated files have no audio to compare
+                if bound is not None and bound[1] - bound[0] >= MIN_AUDIO_SIZE:
+                    bounds[entry.path] = bound
+        groups = groupBy(files, lambda entry: bounds[entry.path][1] - bounds[entry.path][0] if entry.path in bounds else None)
+        groups = hashGroups(pool, groups, bounds, 'Partial hashing', partialHash)
+        # Files small enough for the partial hash were already fully hashed
+        small = [group for group in groups if bounds[group[0].path][1] - bounds[group[0].path][0] <= PARTIAL_HASH_SIZE * 2]
+        large = [group for group in groups if bounds[group[0].path][1] - bounds[group[0].path][0] > PARTIAL_HASH_SIZE * 2]
+        groups = small + hashGroups(pool, large, bounds, 'Full hashing', fullHash)
+        sameAudio = {entry.path: n for n, group in enumerate(groups) for entry in group}
+        if similar:
+            # One file of each audio group stands for it in the tag grouping
+            copies = {entry.path for group in groups for entry in rankCopies(group, {})[1:]}
+            songs = [entry for entry in files if entry.path in bounds and entry.path not in copies]
+            groups = mergeGroups(groups + similarGroups(pool, songs, bounds, tagsBackend))
+        toRead = [entry for group in groups for entry in group]
+        infos = {}
+        with Bar('Reading audio headers', max=len(toRead)) as bar:
+            for entry, info in zip(toRead, pool.map(instrument.timed(lambda entry: audioInfoOrNone(entry, bounds[entry.path]), "audio_info"), toRead)):
+                bar.next()
+                infos[entry.path] = instrument.unwrap(info)
+    for group in groups:
+        group = rankCopies(group, infos)
+        kept = sameAudio.get(group[0].path)
+        for entry in group[1:]:
+            track, name = readTags(entry.path, tagsBackend)
+            info = infos.get(entry.path)
+            match = "audio" if kept is not None and sameAudio.get(entry.path) == kept else "tags"
+            fileList.append({"path": entry.path, "size": entry.size, "track": track, "name": name,
+                "bitrate": info.bitrate if info else None, "duration": round(info.duration, 1) if info else None,
+                "sample_rate": info.sample_rate if info else None, "match": match, "original": group[0].path})
     return fileList
 
-def filter_duplicates(extension, types, path, fileList, size):
-    if extension in types:
-        mp3 = MP3File(path)
-        tags = "empty"
-        try:
-            tags = mp3.get_tags()
-        except UnicodeDecodeError as err:
-            click.echo("\nError retreiving tags, file: {} - error: {}".format(path, err.reason))
-        except:
-            click.echo("\nBad MP3 tags , file: {}".format(path))
-        for i in range(9): 
-            suffix  = "({})".format(i)
-            suffix2 = "_{}.".format(i)
-            if suffix in path or suffix2 in path:
-                track = "empty"
-                name = "empty"
-                if tags['ID3TagV2'] and tags['ID3TagV2']['track']:
-                    track = tags['ID3TagV2']['track']
-                if tags['ID3TagV2'] and tags['ID3TagV2']['song']:
-                    name = tags['ID3TagV2']['song']
-                DUPLICATES.onemore()
-                fileList.append({"path": path, "size": size, "track": track, "name": name})
+def mergeGroups(groups):
+    """ Join the groups that share a file, files keep their first seen order """
+    merged = []
+    owner = {}
+    for group in groups:
+        joined = sorted({owner[entry.path] for entry in group if entry.path in owner})
+        if not joined:
+            target = len(merged)
+            merged.append([])
+        else:
+            target = joined[0]
+            for other in joined[1:]:
+                for entry in merged[other]:
+                    owner[entry.path] = target
+                merged[target] += merged[other]
+                merged[other] = []
+        for entry in group:
+            if owner.get(entry.path) != target:
+                owner[entry.path] = target
+                merged[target].append(entry)
+    return [group for group in merged if group]
+
+def rankCopies(group, infos):
+    """
+    Best copy first: highest bitrate, then longest duration, then the name
+    without "(n)" / "_n." and the shortest name
+    """
+    def quality(entry):
+        info = infos.get(entry.path)
+        return (-(info.bitrate if info else 0), -(info.duration if info else 0),
+            isCopyName(entry.name), len(entry.name), entry.path)
+    return sorted(group, key=quality)
+
+def similarGroups(pool, files, bounds, tagsBackend):
+    """
+    Group files with the same artist and title whose durations are at most
+    DURATION_TOLERANCE apart. Only the frame header of each file is read
+    for the duration, no decoding.
+    """
+    songs = {}
+    with Bar('Reading tags and headers', max=len(files)) as bar:
+        for entry, found in zip(files, pool.map(instrument.timed(lambda entry: songKey(entry, bounds[entry.path], tagsBackend), "tags"), files)):
+            bar.next()
+            found = instrument.unwrap(found)
+            if found is not None:
+                key, duration = found
+                songs.setdefault(key, []).append((duration, entry))
+    groups = []
+    for candidates in songs.values():
+        candidates.sort(key=lambda candidate: (candidate[0], candidate[1].path))
+        group = [candidates[0][1]]
+        for previous, current in zip(candidates, candidates[1:]):
+            if current[0] - previous[0] > DURATION_TOLERANCE:
+                if len(group) > 1:
+                    groups.append(group)
+                group = []
+            group.append(current[1])
+        if len(group) > 1:
+            groups.append(group)
+    return groups
+
+def songKey(entry, bound, tagsBackend):
+    """ ((artist, title), duration) of a file, None without both tags or a frame header """
+    try:
+        tags = read_tags(entry.path, tagsBackend)
+        info = read_audio_info(entry.path, bound)
+    except Exception:
+        return None
+    if not tags.artist or not tags.title or info is None:
+        return None
+    return (tags.artist.strip().casefold(), tags.title.strip().casefold()), info.duration
+
+def audioInfoOrNone(entry, bound):
+    try:
+        return read_audio_info(entry.path, bound)
+    except OSError as error:
+        click.echo("\nError reading file: {} - error: {}".format(entry.path, error))
+        return None
+
+def groupBy(files, key):
+    """ Bucket files by key, dropping None keys and buckets with a single file """
+    buckets = {}
+    for entry in files:
+        value = key(entry)
+        if value is not None:
+            buckets.setdefault(value, []).append(entry)
+    return [bucket for bucket in buckets.values() if len(bucket) > 1]
+
+def hashGroups(pool, groups, bounds, message, hashFunction):
+    files = [entry for group in groups for entry in group]
+    hashes = {}
+    with Bar(message, max=len(files)) as bar:
+        for entry, digest in zip(files, pool.map(instrument.timed(lambda entry: safeHash(hashFunction, entry, bounds[entry.path]), hashFunction.__name__), files)):
+            bar.next()
+            hashes[entry.path] = instrument.unwrap(digest)
+    regrouped = []
+    for group in groups:
+        regrouped += groupBy(group, lambda entry: hashes[entry.path])
+    return regrouped
+
+def safeHash(hashFunction, entry, bound):
+    try:
+        return hashFunction(entry.path, *bound)
+    except OSError as error:
+        click.echo("\nError reading file: {} - error: {}".format(entry.path, error))
+        return None
+
+def audioBoundsOrNone(entry):
+    try:
+        return audio_bounds(entry.path, entry.size)
+    except OSError as error:
+        click.echo("\nError reading file: {} - error: {}".format(entry.path, error))
+        return None
+
+def partialHash(path, start, end):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        if end - start <= PARTIAL_HASH_SIZE * 2:
+            f.seek(start)
+            digest.update(f.read(end - start))
+        else:
+            f.seek(start)
+            digest.update(f.read(PARTIAL_HASH_SIZE))
+            f.seek(end - PARTIAL_HASH_SIZE)
+            digest.update(f.read(PARTIAL_HASH_SIZE))
+    return digest.hexdigest()
+
+def fullHash(path, start, end):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(remaining, 1024 * 1024))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+
+def isCopyName(name):
+    return any(suffix in name for suffix in COPY_SUFFIXES)
+
+def readTags(path, backend="id3"):
+    track = "empty"
+    name = "empty"
+    try:
+        tags = read_tags(path, backend)
+        track = tags.track or track
+        name = tags.title or name
+    except Exception as err:
+        click.echo("\nBad MP3 tags , file: {} - error: {}".format(path, err))
+    return track, name
 
 @click.command()
 @click.argument('folder')
-def find_duplicates(folder):
+@click.option('--move', default=MOVE_FOLDER, help='folder to move duplicates (default={})'.format(MOVE_FOLDER))
+@click.option('--undo', is_flag=True, help='move the files of the last run back from the --move folder')
+@click.option('--undo-all', is_flag=True, help='like --undo, for every run kept in the move journal')
+@click.option('--tags', default="id3", type=click.Choice(available_backends()), help='tag reader backend (default=id3)')
+@click.option('--similar', is_flag=True, help='also take files with the same artist, title and duration as duplicates')
+@click.option('--profile', default=None, metavar='PATH', help='write a JSON report of stage timings and per file latency')
+@click.option('--cprofile', is_flag=True, help='include cProfile data in the --profile report')
+def find_duplicates(folder, move, undo, undo_all, tags, similar, profile, cprofile):
+    with instrument.profiling("find_duplicates", profile, cprofile):
+        cleanDuplicates(folder, move, undo or undo_all, tags, similar, undo_all)
+    if profile:
+        click.echo("Profile report saved: {}".format(profile))
+
+def cleanDuplicates(folder, move, undo, tags, similar, undoAll=False):
     folder = folder.strip()
+    move = move.strip()
     click.echo("\nMP3 duplicate finder tool\n")
+    if not os.path.isdir(move) or move == folder:
+        click.echo("Invalid move folder: {}".format(move))
+        click.echo("Please, check the path. Aborting.")
+        return
+    if undo:
+        restored = undoMoves(move, undoAll)
+        click.echo("Restored {} files.\n".format(len(restored)))
+        return
     click.echo("Folder: {}".format(folder))
-    folders = findAllFolders(folder)
-    fileList = []
-    for folder in folders:
-        folderFileList = getFilesFromFolder(folder)
-        if len(folderFileList) > 0:
-            fileList = fileList + folderFileList
+    with instrument.stats().stage("analyse"):
+        fileList = getFilesFromFolder(folder, tagsBackend=tags, similar=similar)
+    instrument.stats().count("duplicates", len(fileList))
     if len(fileList) > 0:
         click.echo("Found {} duplicated files.".format(len(fileList)))
         with open(os.path.join(pathlib.Path().absolute(), "duplicated-files-log.json"), "w+") as log_file:
             json.dump(fileList, log_file)
-        moveFiles(fileList, "D:\\Work\\MP3-Duplicada")
+        moveFiles(fileList, move)
         click.echo("\nDone.\n")
     else:
         click.echo("\nNo duplicates found.\n")
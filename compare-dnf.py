@@ -1,118 +1,251 @@
 import argparse
+import csv
+import fnmatch
+import hashlib
+import io
+import json
+import pickle
+import shlex
+import subprocess
 import sys
 import tempfile
 import os
+import string
+from concurrent.futures import ProcessPoolExecutor
+from functools import cmp_to_key, lru_cache, partial
+from operator import attrgetter
+from typing import NamedTuple
 
 #!/usr/bin/env python3
 
+DIGITS = frozenset(string.digits)
+LETTERS = frozenset(string.ascii_letters)
+ALNUM = DIGITS | LETTERS
+EVR_CACHE_SIZE = 1 << 16
+UPGRADED = "upgraded"
+DOWNGRADED = "downgraded"
+REBUILT = "rebuilt"
+CACHE_SUFFIX = ".cache"
+CACHE_VERSION = 1
+SNAPSHOT_PATTERN = "*-installed.txt"
+DEFAULT_ARG_MAX = 128 * 1024
+ARG_HEADROOM = 4096
+POINTER_SIZE = 8
+PACKAGE_COMMANDS = {
+    "dnf": {"install": ["dnf", "--skip-unavailable", "install"], "remove": ["dnf", "remove"]},
+    "flatpak": {"install": ["flatpak", "install"], "remove": ["flatpak", "uninstall"]},
+}
+
+class FlatpakPackage(NamedTuple):
+    name: str           # e.g., "Bambu Studio"
+    app_id: str         # e.g., "com.bambulab.BambuStudio"
+    version: str        # e.g., "2.3.0 Public Release"
+    branch: str         # e.g., "stable"
+    origin: str         # e.g., "flathub"
+    installation: str   # e.g., "system" or "user"
+
+
+class FedoraPackage(NamedTuple):
+    full_name: str      # e.g., "Box2D.x86_64"
+    name: str           # e.g., "Box2D"
+    architecture: str   # e.g., "x86_64"
+    version: str        # e.g., "2.4.2-3.fc42"
+    source: str         # e.g., "781e4eb56ba449a5876af2cc084d758e"
+
+
 def parse_flatpak_packages(file_path):
     """
-    Parse the fedora-flatpak-installed.txt file into a list of package information.
+    Parse a fedora-flatpak-installed.txt file, one package per line.
 
     Args:
         file_path (str): Path to the fedora-flatpak-installed.txt file
 
-    Returns:
-        list: List of dictionaries containing Flatpak package information, or None if error
+    Yields:
+        FlatpakPackage: One record per package line
+
+    Raises:
+        OSError: If the file can't be read
+        ValueError: If a line doesn't look like flatpak list output
     """
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
+    with open(file_path, "r", encoding="utf-8") as f:
+        yield from parse_flatpak_lines(f)
 
-        packages = []
 
-        for line in lines:
-            line = line.strip()
+def parse_flatpak_lines(lines):
+    """ parse_flatpak_packages over any iterable of lines """
+    for line in lines:
+        # Flatpak uses tab-separated columns
+        parts = line.strip().split("\t")
+        if len(parts) >= 6:
+            if parts[5] == "user":
+                yield FlatpakPackage(*parts[:6])
+        elif len(parts) >= 5:
+            yield FlatpakPackage(parts[0], parts[1], parts[2], parts[3], "default", parts[4])
+        elif parts != [""]:
+            raise ValueError("Invalid Flatpak package line format")
 
-            # Skip empty lines
-            if not line:
-                continue
 
-            # Split the line by tabs (Flatpak uses tab-separated format)
-            parts = line.split('\t')
-            if len(parts) >= 6:
-                if parts[5] == "user":
-                    package_info = {
-                        "name": parts[0],           # e.g., "Bambu Studio"
-                        "app_id": parts[1],         # e.g., "com.bambulab.BambuStudio"
-                        "version": parts[2],        # e.g., "2.3.0 Public Release"
-                        "branch": parts[3],         # e.g., "stable"
-                        "origin": parts[4],         # e.g., "flathub"
-                        "installation": parts[5],   # e.g., "system" or "user"
-                    }
-                    packages.append(package_info)
-            elif len(parts) >= 5:
-                package_info = {
-                    "name": parts[0],           # e.g., "Bambu Studio"
-                    "app_id": parts[1],         # e.g., "com.bambulab.BambuStudio"
-                    "version": parts[2],        # e.g., "2.3.0 Public Release"
-                    "branch": parts[3],         # e.g., "stable"
-                    "origin": "default",        # e.g., "flathub"
-                    "installation": parts[4],   # default to system if not specified
-                }
-                packages.append(package_info)
-            else:
-                raise ValueError("Invalid Flatpak package line format")
-                    
-        return packages
-
-    except FileNotFoundError:
-        print(f"Error: File '{file_path}' not found")
+def parse_fedora_packages(file_path):
+    """
+    Parse a `dnf list installed` dump (fedora-desktop-installed.txt), one
+    package per line.
+
+    Args:
+        file_path (str): Path to the fedora-desktop-installed.txt file
+
+    Yields:
+        FedoraPackage: One record per package line
+
+    Raises:
+        OSError: If the file can't be read
+    """
+    with open(file_path, "r", encoding="utf-8") as f:
+        yield from parse_fedora_lines(f)
+
+
+def parse_fedora_lines(lines):
+    """ parse_fedora_packages over any iterable of lines """
+    for line in lines:
+        parts = line.split()
+        # Skips empty lines and the "Pacotes instalados" header
+        if len(parts) < 3:
+            continue
+        full_name = parts[0]
+        name, dot, architecture = full_name.rpartition(".")
+        if not dot:
+            name, architecture = full_name, "noarch"
+        yield FedoraPackage(full_name, name, architecture, parts[1],
+                            parts[2] if len(parts) == 3 else " ".join(parts[2:]))
+
+
+def _load_cache(file_path, kind):
+    """ Return the cache content of file_path if it is of kind, else None """
+    try:
+        with open(file_path + CACHE_SUFFIX, "rb") as f:
+            cached = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
         return None
-    except IOError as e:
-        print(f"Error reading file: {e}")
+    if not isinstance(cached, dict) or cached.get("version") != CACHE_VERSION or cached.get("kind") != kind:
         return None
+    return cached
 
 
-def parse_fedora_packages(file_path):
+def _cached_snapshot(file_path, is_flatpak=False):
     """
-    Parse the fedora-desktop-installed.txt file into a list of package information.
+    Return the cached packages of a snapshot as plain tuples, or None.
+
+    The cache (file_path + CACHE_SUFFIX) holds the parsed packages, the
+    source's mtime and size and a blake2b digest of its content. Only
+    matching mtime and size are trusted here, anything else goes through
+    _read_snapshot.
+    """
+    stat = os.stat(file_path)
+    cached = _load_cache(file_path, "flatpak" if is_flatpak else "fedora")
+    if cached and cached["mtime"] == stat.st_mtime_ns and cached["size"] == stat.st_size:
+        return cached["packages"]
+    return None
+
+
+def _read_snapshot(file_path, is_flatpak=False, use_cache=True):
+    """
+    Parse a snapshot into plain tuples and refresh its cache.
+
+    A cache whose digest still matches the content (file touched or
+    copied, content unchanged) is reused without parsing. Runs in pool
+    workers, hence plain tuples: the record classes may live in __main__.
+    """
+    kind = "flatpak" if is_flatpak else "fedora"
+    stat = os.stat(file_path)
+    with open(file_path, "rb") as f:
+        data = f.read()
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    cached = _load_cache(file_path, kind) if use_cache else None
+    if cached and cached["digest"] == digest:
+        packages = cached["packages"]
+    else:
+        parse = parse_flatpak_lines if is_flatpak else parse_fedora_lines
+        packages = [tuple(pkg) for pkg in parse(io.StringIO(data.decode("utf-8")))]
+    if use_cache:
+        _write_cache(file_path + CACHE_SUFFIX, {"version": CACHE_VERSION, "kind": kind, "mtime": stat.st_mtime_ns,
+                                                "size": stat.st_size, "digest": digest, "packages": packages})
+    return packages
+
+
+def _write_cache(cache_path, content):
+    # Written aside and renamed so a concurrent reader never sees half a file
+    try:
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cache_path)), suffix=".tmp")
+    except OSError:
+        # Read only snapshot folder, just go without cache
+        return
+    try:
+        with os.fdopen(handle, "wb") as f:
+            pickle.dump(content, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        os.unlink(temp_path)
+
+
+def load_snapshot(file_path, is_flatpak=False, use_cache=True):
+    """
+    Load the packages of a snapshot file, reusing its parsed cache.
 
     Args:
-        file_path (str): Path to the fedora-desktop-installed.txt file
+        file_path (str): Snapshot file
+        is_flatpak (bool): Parse it as a Flatpak package list
+        use_cache (bool): Read and write the cache next to the file
 
     Returns:
-        list: List of dictionaries containing package information, or None if error
+        list: FedoraPackage or FlatpakPackage records
     """
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
+    return load_snapshots([file_path], is_flatpak, use_cache, 1)[0]
 
-        packages = []
 
-        for line in lines:
-            line = line.strip()
+def load_snapshots(files, is_flatpak=False, use_cache=True, jobs=None):
+    """
+    Load many snapshot files, parsing the ones without a valid cache on a
+    process pool. Valid caches are read in process, shipping their
+    packages back from a worker would cost as much as unpickling them.
 
-            # Skip empty lines and header
-            if not line or line == "Pacotes instalados":
-                continue
+    Args:
+        files (list): Snapshot files
+        is_flatpak (bool): Parse them as Flatpak package lists
+        use_cache (bool): Read and write the caches next to the files
+        jobs (int): Worker processes, CPU count if None, 1 parses in process
 
-            # Split the line into components
-            parts = line.split()
-            if len(parts) >= 3:
-                package_info = {
-                    "full_name": parts[0],  # e.g., "Box2D.x86_64"
-                    "name": parts[0].split(".")[0]
-                    if "." in parts[0]
-                    else parts[0],  # e.g., "Box2D"
-                    "architecture": parts[0].split(".")[1]
-                    if "." in parts[0]
-                    else "noarch",  # e.g., "x86_64"
-                    "version": parts[1],  # e.g., "2.4.2-3.fc42"
-                    "source": " ".join(
-                        parts[2:]
-                    ),  # e.g., "781e4eb56ba449a5876af2cc084d758e"
-                }
-                packages.append(package_info)
-
-        return packages
-
-    except FileNotFoundError:
-        print(f"Error: File '{file_path}' not found")
-        return None
-    except IOError as e:
-        print(f"Error reading file: {e}")
-        return None
+    Returns:
+        list: One list of records per file, in the order of files
+    """
+    record = FlatpakPackage if is_flatpak else FedoraPackage
+    results = [_cached_snapshot(f, is_flatpak) if use_cache else None for f in files]
+    missing = [i for i, packages in enumerate(results) if packages is None]
+    read = partial(_read_snapshot, is_flatpak=is_flatpak, use_cache=use_cache)
+    if jobs == 1 or len(missing) < 2:
+        parsed = map(read, (files[i] for i in missing))
+        for i, packages in zip(missing, parsed):
+            results[i] = packages
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for i, packages in zip(missing, pool.map(read, [files[i] for i in missing])):
+                results[i] = packages
+    return [list(map(record._make, packages)) for packages in results]
+
+
+def snapshot_files(paths, is_flatpak=False):
+    """
+    Expand folders into their snapshot files, sorted by name: files
+    matching SNAPSHOT_PATTERN, with "flatpak" in the name for Flatpak
+    lists and without it otherwise. Files are passed through.
+    """
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for name in sorted(os.listdir(path)):
+            if fnmatch.fnmatch(name, SNAPSHOT_PATTERN) and ("flatpak" in name) == is_flatpak:
+                files.append(os.path.join(path, name))
+    return files
 
 
 def compare_package_lists(original, new, field="name"):
@@ -120,14 +253,16 @@ def compare_package_lists(original, new, field="name"):
     Compare two lists of package information and identify added and removed packages.
 
     Args:
-        original (list): List of package dictionaries from the original file
-        new (list): List of package dictionaries from the new file
+        original (iterable): Package records from the original file
+        new (iterable): Package records from the new file
+        field (str): Record field identifying a package
 
     Returns:
         tuple: (added_packages, removed_packages)
     """
-    original_set = set(pkg[field] for pkg in original)
-    new_set = set(pkg[field] for pkg in new)
+    key = attrgetter(field)
+    original_set = set(map(key, original))
+    new_set = set(map(key, new))
 
     added_packages = new_set - original_set
     removed_packages = original_set - new_set
@@ -135,68 +270,582 @@ def compare_package_lists(original, new, field="name"):
     return added_packages, removed_packages
 
 
+def split_evr(evr):
+    """
+    Split an RPM version string into its parts.
+
+    Args:
+        evr (str): [epoch:]version[-release], e.g. "1:7.1.1.47-3.fc43"
+
+    Returns:
+        tuple: (epoch, version, release), epoch 0 and release "" if absent
+    """
+    epoch, colon, rest = evr.partition(":")
+    if not colon:
+        epoch, rest = "0", evr
+    version, _, release = rest.rpartition("-")
+    if not version:
+        version, release = release, ""
+    return int(epoch) if epoch.isdigit() else 0, version, release
+
+
+def rpmvercmp(a, b):
+    """
+    Compare two version or release strings like rpm does.
+
+    Strings are split into runs of digits and runs of letters, anything
+    else only separates them. Digit runs compare numerically and are newer
+    than letter runs, "~" sorts before anything (pre-releases, 1.0~rc1 <
+    1.0) and "^" after the end of the string but before any other run
+    (snapshots, 1.0 < 1.0^git1 < 1.0.1).
+
+    Returns:
+        int: -1, 0 or 1
+    """
+    if a == b:
+        return 0
+    i = j = 0
+    len_a, len_b = len(a), len(b)
+    while i < len_a or j < len_b:
+        while i < len_a and a[i] not in ALNUM and a[i] not in "~^":
+            i += 1
+        while j < len_b and b[j] not in ALNUM and b[j] not in "~^":
+            j += 1
+
+        tilde_a = i < len_a and a[i] == "~"
+        tilde_b = j < len_b and b[j] == "~"
+        if tilde_a or tilde_b:
+            if not tilde_a:
+                return 1
+            if not tilde_b:
+                return -1
+            i += 1
+            j += 1
+            continue
+
+        caret_a = i < len_a and a[i] == "^"
+        caret_b = j < len_b and b[j] == "^"
+        if caret_a or caret_b:
+            if i >= len_a:
+                return -1
+            if j >= len_b:
+                return 1
+            if not caret_a:
+                return 1
+            if not caret_b:
+                return -1
+            i += 1
+            j += 1
+            continue
+
+        if i >= len_a or j >= len_b:
+            break
+
+        numeric = a[i] in DIGITS
+        kind = DIGITS if numeric else LETTERS
+        start_a, start_b = i, j
+        while i < len_a and a[i] in kind:
+            i += 1
+        while j < len_b and b[j] in kind:
+            j += 1
+        segment_a, segment_b = a[start_a:i], b[start_b:j]
+        if not segment_b:
+            # Different kinds of run, numbers are newer
+            return 1 if numeric else -1
+        if numeric:
+            segment_a = segment_a.lstrip("0")
+            segment_b = segment_b.lstrip("0")
+            if len(segment_a) != len(segment_b):
+                return 1 if len(segment_a) > len(segment_b) else -1
+        if segment_a != segment_b:
+            return 1 if segment_a > segment_b else -1
+
+    if i >= len_a and j >= len_b:
+        return 0
+    return -1 if i >= len_a else 1
+
+
+@lru_cache(maxsize=EVR_CACHE_SIZE)
+def compare_evr(a, b):
+    """
+    Compare two [epoch:]version-release strings, memoized since fleet
+    reports compare the same few thousand versions over and over.
+
+    Returns:
+        int: -1 if a is older than b, 0 if equal, 1 if newer
+    """
+    epoch_a, version_a, release_a = split_evr(a)
+    epoch_b, version_b, release_b = split_evr(b)
+    if epoch_a != epoch_b:
+        return 1 if epoch_a > epoch_b else -1
+    return rpmvercmp(version_a, version_b) or rpmvercmp(release_a, release_b)
+
+
+def classify_version_change(old, new):
+    """
+    Classify the move from EVR old to EVR new.
+
+    Returns:
+        str: UPGRADED, DOWNGRADED, REBUILT (same epoch and version, new
+        release) or None if both are the same EVR
+    """
+    order = compare_evr(new, old)
+    if order == 0:
+        return None
+    if order < 0:
+        return DOWNGRADED
+    epoch_old, version_old, _ = split_evr(old)
+    epoch_new, version_new, _ = split_evr(new)
+    if epoch_old == epoch_new and rpmvercmp(version_old, version_new) == 0:
+        return REBUILT
+    return UPGRADED
+
+
+def newest_versions(packages):
+    """
+    Map (name, architecture) to the newest installed EVR, so multilib
+    packages stay apart and install-only packages such as kernel report
+    their latest version.
+    """
+    versions = {}
+    for pkg in packages:
+        key = (pkg.name, pkg.architecture)
+        current = versions.get(key)
+        if current is None or compare_evr(pkg.version, current) > 0:
+            versions[key] = pkg.version
+    return versions
+
+
+def compare_package_versions(original, new):
+    """
+    Report version changes of packages present in both lists.
+
+    Args:
+        original (iterable): FedoraPackage records from the original file
+        new (iterable): FedoraPackage records from the new file
+
+    Returns:
+        dict: {UPGRADED|DOWNGRADED|REBUILT: [("name.arch", old, new), ...]}
+    """
+    original_versions = newest_versions(original)
+    new_versions = newest_versions(new)
+    changes = {UPGRADED: [], DOWNGRADED: [], REBUILT: []}
+    for key, old in original_versions.items():
+        current = new_versions.get(key)
+        if current is None:
+            continue
+        kind = classify_version_change(old, current)
+        if kind:
+            changes[kind].append((f"{key[0]}.{key[1]}", old, current))
+    for entries in changes.values():
+        entries.sort()
+    return changes
+
+
+class Fleet(NamedTuple):
+    hosts: list             # host labels, index = host ID
+    packages: list          # interned package keys, index = package ID
+    host_bits: list         # per package, bitset of the hosts that have it
+    package_bits: list      # per host, bitset of the packages it has
+    versions: list          # per package, {version: bitset of hosts}
+
+
+def build_fleet(snapshots, field="name"):
+    """
+    Intern the packages of many hosts into integer IDs and bitsets.
+
+    Every host and package gets a small integer ID. Presence is kept both
+    ways as Python int bitsets (hosts per package and packages per host),
+    so fleet wide questions become a handful of integer ANDs and popcounts
+    instead of pairwise set diffs between every two hosts.
+
+    Args:
+        snapshots (iterable): (host label, package records) pairs
+        field (str): Record field identifying a package
+
+    Returns:
+        Fleet: Interned presence and version data
+    """
+    key = attrgetter(field)
+    hosts, packages, host_bits, package_bits, versions = [], [], [], [], []
+    ids = {}
+    for host_id, (host, records) in enumerate(snapshots):
+        hosts.append(host)
+        host_bit = 1 << host_id
+        # Bits are set in a bytearray, growing an int one bit at a time is quadratic
+        bits = bytearray()
+        for record in records:
+            name = key(record)
+            package_id = ids.get(name)
+            if package_id is None:
+                package_id = ids[name] = len(packages)
+                packages.append(name)
+                host_bits.append(0)
+                versions.append({})
+            host_bits[package_id] |= host_bit
+            byte = package_id >> 3
+            if byte >= len(bits):
+                bits.extend(bytes(byte + 1 - len(bits)))
+            bits[byte] |= 1 << (package_id & 7)
+            seen = versions[package_id]
+            seen[record.version] = seen.get(record.version, 0) | host_bit
+        package_bits.append(int.from_bytes(bits, "little"))
+    return Fleet(hosts, packages, host_bits, package_bits, versions)
+
+
+def iter_bits(bits):
+    """ Yield the positions of the set bits of an int, lowest first """
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def host_counts(fleet):
+    """ Return the number of hosts that have each package, by package ID """
+    return [bits.bit_count() for bits in fleet.host_bits]
+
+
+def fleet_summary(fleet):
+    """
+    Classify every package of the fleet.
+
+    Args:
+        fleet (Fleet): Result of build_fleet
+
+    Returns:
+        dict: "common" (on every host), "unique" ({host: packages only it
+        has}) and "skewed" ({package: {version: [hosts]}} for packages
+        installed with more than one version)
+    """
+    everyone = (1 << len(fleet.hosts)) - 1
+    common, skewed = [], {}
+    unique = {host: [] for host in fleet.hosts}
+    for package_id, bits in enumerate(fleet.host_bits):
+        name = fleet.packages[package_id]
+        if bits == everyone:
+            common.append(name)
+        elif bits & (bits - 1) == 0:
+            unique[fleet.hosts[bits.bit_length() - 1]].append(name)
+        versions = fleet.versions[package_id]
+        if len(versions) > 1:
+            skewed[name] = {version: [fleet.hosts[h] for h in iter_bits(hosts)] for version, hosts in versions.items()}
+    return {"common": common, "unique": unique, "skewed": skewed}
+
+
+def fleet_drift(fleet, baseline=0, classify=classify_version_change):
+    """
+    Compare every host against a baseline host.
+
+    Args:
+        fleet (Fleet): Result of build_fleet
+        baseline (int): Host ID of the baseline
+        classify (callable): (baseline version, host version) -> kind of
+            change, None to skip the classification
+
+    Returns:
+        dict: {host: {"added": [...], "removed": [...], "changed": {package: [baseline version, host version, kind]}}}
+    """
+    classify = classify or (lambda old, new: None)
+    reference = fleet.package_bits[baseline]
+    baseline_bit = 1 << baseline
+    changed = [{} for _ in fleet.hosts]
+    # Walked per package rather than per host: each version's host bitset
+    # says at once which hosts differ from the baseline
+    for package_id, versions in enumerate(fleet.versions):
+        if len(versions) < 2 or not fleet.host_bits[package_id] & baseline_bit:
+            continue
+        name = fleet.packages[package_id]
+        # Install-only packages (kernel) can have several, a host counts
+        # with its newest one
+        assigned = 0
+        theirs = None
+        newest_first = sorted(versions, key=cmp_to_key(compare_evr), reverse=True)
+        for version in newest_first:
+            if versions[version] & baseline_bit:
+                theirs = version
+                break
+        for version in newest_first:
+            hosts = versions[version] & ~assigned
+            assigned |= hosts
+            if version == theirs:
+                continue
+            kind = classify(theirs, version)
+            for host_id in iter_bits(hosts):
+                changed[host_id][name] = [theirs, version, kind]
+
+    drift = {}
+    for host_id, bits in enumerate(fleet.package_bits):
+        if host_id == baseline:
+            continue
+        drift[fleet.hosts[host_id]] = {
+            "added": [fleet.packages[i] for i in iter_bits(bits & ~reference)],
+            "removed": [fleet.packages[i] for i in iter_bits(reference & ~bits)],
+            "changed": changed[host_id],
+        }
+    return drift
+
+
+def write_presence_matrix(fleet, file_path):
+    """
+    Write a CSV presence matrix: one row per package with its host count,
+    then 1/0 per host.
+    """
+    counts = host_counts(fleet)
+    with open(file_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["package", "hosts"] + fleet.hosts)
+        for package_id, name in sorted(enumerate(fleet.packages), key=lambda item: item[1]):
+            bits = fleet.host_bits[package_id]
+            writer.writerow([name, counts[package_id]] + [(bits >> h) & 1 for h in range(len(fleet.hosts))])
+
+
+def host_label(file_path):
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def compare_fleet(files, is_flatpak=False, baseline=None, matrix=None, report=None, use_cache=True, jobs=None):
+    """
+    N-way comparison of package snapshots, one file per host.
+
+    Args:
+        files (list): Snapshot files or folders of snapshots, the host
+            label is the file name without extension
+        is_flatpak (bool): Parse files as Flatpak package lists
+        baseline (str): Host label or file of the drift baseline, the
+            first file if None
+        matrix (str): Optional CSV presence matrix output path
+        report (str): Optional JSON report output path
+        use_cache (bool): Use the parsed snapshot caches
+        jobs (int): Worker processes loading the snapshots
+
+    Returns:
+        dict: Report with summary, drift and per-package host counts
+    """
+    files = snapshot_files(files, is_flatpak)
+    if not files:
+        raise ValueError("No snapshot files to compare")
+    # name.arch for RPMs, multilib packages are distinct packages
+    field = "app_id" if is_flatpak else "full_name"
+    labels = [host_label(f) for f in files]
+    if len(set(labels)) != len(labels):
+        # Same file name in different folders, fall back to the paths
+        labels = list(files)
+    snapshots = load_snapshots(files, is_flatpak, use_cache, jobs)
+    fleet = build_fleet(zip(labels, snapshots), field)
+
+    if baseline is None:
+        baseline_id = 0
+    elif baseline in labels:
+        baseline_id = labels.index(baseline)
+    elif baseline in files:
+        baseline_id = files.index(baseline)
+    else:
+        raise ValueError(f"Baseline '{baseline}' is not one of the compared hosts")
+
+    summary = fleet_summary(fleet)
+    drift = fleet_drift(fleet, baseline_id, None if is_flatpak else classify_version_change)
+    counts = dict(zip(fleet.packages, host_counts(fleet)))
+
+    print(f"Hosts...........: {len(fleet.hosts)}")
+    print(f"Packages........: {len(fleet.packages)}")
+    print(f"On every host...: {len(summary['common'])}")
+    print(f"Version skewed..: {len(summary['skewed'])}")
+    print(f"Baseline........: {fleet.hosts[baseline_id]}")
+    width = max(len(host) for host in fleet.hosts)
+    for host in fleet.hosts:
+        line = f"  {host:<{width}}  {len(summary['unique'][host]):6} unique"
+        if host in drift:
+            d = drift[host]
+            line += f"  +{len(d['added'])} -{len(d['removed'])} ~{len(d['changed'])} vs baseline"
+        print(line)
+
+    result = {"hosts": fleet.hosts, "baseline": fleet.hosts[baseline_id],
+              "common": summary["common"], "unique": summary["unique"],
+              "skewed": summary["skewed"], "drift": drift, "host_counts": counts}
+    if matrix:
+        write_presence_matrix(fleet, matrix)
+        print(f"Presence matrix written to: {matrix}")
+    if report:
+        with open(report, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+        print(f"Fleet report written to: {report}")
+    return result
+
+
+def argument_limit():
+    """
+    Return how many bytes of arguments a command may take: ARG_MAX minus
+    the environment (also copied on exec) and some headroom.
+    """
+    try:
+        arg_max = os.sysconf("SC_ARG_MAX")
+    except (AttributeError, ValueError, OSError):
+        arg_max = DEFAULT_ARG_MAX
+    if arg_max <= 0:
+        arg_max = DEFAULT_ARG_MAX
+    environment = sum(len(os.fsencode(key)) + len(os.fsencode(value)) + 2 + POINTER_SIZE
+                      for key, value in os.environ.items())
+    return arg_max - environment - ARG_HEADROOM
+
+
+def _argument_size(argument):
+    # The string, its NUL and the argv pointer
+    return len(os.fsencode(argument)) + 1 + POINTER_SIZE
+
+
+def batch_packages(command, packages, limit=None):
+    """
+    Split packages into batches whose full command lines fit in ARG_MAX.
+
+    Args:
+        command (list): Command and options put before every batch
+        packages (iterable): Package names
+        limit (int): Argument bytes allowed, argument_limit() if None
+
+    Yields:
+        list: Package names of one batch
+    """
+    limit = limit or argument_limit()
+    base = sum(map(_argument_size, command))
+    batch, size = [], base
+    for pkg in packages:
+        needed = _argument_size(pkg)
+        if batch and size + needed > limit:
+            yield batch
+            batch, size = [], base
+        batch.append(pkg)
+        size += needed
+    if batch:
+        yield batch
+
+
+def package_command(is_flatpak, action, assume_yes=False):
+    """ Return the argv prefix that installs or removes packages """
+    command = list(PACKAGE_COMMANDS["flatpak" if is_flatpak else "dnf"][action])
+    if assume_yes:
+        command.append("-y")
+    return command
+
+
+def write_script(file, command, batches):
+    """ Write one shell command line per batch, stopping at the first failure """
+    lines = ["#!/bin/sh", "set -e"]
+    lines.extend(shlex.join(command + batch) for batch in batches)
+    file.write("\n".join(lines) + "\n")
+
+
+def emit_script(path, suffix, command, batches):
+    """
+    Write a batch script to path, or to a new temporary file ending in
+    suffix if path is None, and return its path.
+    """
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            write_script(f, command, batches)
+    else:
+        with tempfile.NamedTemporaryFile(mode="w", suffix=suffix, delete=False, encoding="utf-8") as f:
+            write_script(f, command, batches)
+            path = f.name
+    os.chmod(path, 0o755)
+    return path
+
+
+def run_batches(command, batches):
+    """
+    Run the batches one after the other, stopping at the first failure.
+
+    dnf and flatpak both hold an exclusive lock on their package database
+    while they work, so batches of one manager can't run side by side.
+
+    Returns:
+        int: Exit code of the first failed batch, 0 if all succeeded
+    """
+    for index, batch in enumerate(batches, 1):
+        print(f"Running batch {index}/{len(batches)} ({len(batch)} packages)...")
+        result = subprocess.run(command + batch)
+        if result.returncode:
+            return result.returncode
+    return 0
+
+
 def main():
-    parser = argparse.ArgumentParser(description="Compare two text files")
-    parser.add_argument("file1", help="First text file")
-    parser.add_argument("file2", help="Second text file")
+    parser = argparse.ArgumentParser(description="Compare package list snapshots")
+    parser.add_argument("files", nargs="+", help="Package list files, exactly two unless --fleet is given (then folders of snapshots too)")
     parser.add_argument("--is_flatpak", action="store_true", help="Parse files as Flatpak package lists instead of Fedora packages")
+    parser.add_argument("--fleet", action="store_true", help="N-way comparison of one snapshot per host")
+    parser.add_argument("--baseline", help="Host label or file the fleet drift is measured against (default: the first file)")
+    parser.add_argument("--matrix", help="Write the fleet presence matrix to this CSV file")
+    parser.add_argument("--report", help="Write the full fleet report to this JSON file")
+    parser.add_argument("--jobs", type=int, default=None, help="Worker processes loading fleet snapshots (default: CPU count)")
+    parser.add_argument("--no-cache", dest="cache", action="store_false", help=f"Don't read or write the parsed snapshot caches ({CACHE_SUFFIX} files)")
+    parser.add_argument("--install-script", help="Write the install script for added packages to this file (default: a temporary file)")
+    parser.add_argument("--remove-script", help="Write the remove script for removed packages to this file (default: a temporary file)")
+    parser.add_argument("--run", action="store_true", help="Run the install and remove batches after writing the scripts")
+    parser.add_argument("--yes", action="store_true", help="Pass -y to dnf/flatpak")
+    parser.add_argument("--dry-run", action="store_true", help="Only print how many command batches would be emitted")
     args = parser.parse_args()
+    if not args.fleet and len(args.files) != 2:
+        parser.error("exactly two files are needed, use --fleet to compare more")
+    args.file1, args.file2 = args.files[0], args.files[-1]
 
     try:
-        with open(args.file1, "r") as f1:
-            content1 = f1.read()
-
-        with open(args.file2, "r") as f2:
-            content2 = f2.read()
+        if args.fleet:
+            compare_fleet(args.files, args.is_flatpak, args.baseline, args.matrix, args.report, args.cache, args.jobs)
+            return
 
         print(f"File 1: {args.file1}")
         print(f"File 2: {args.file2}")
-        print("Files loaded successfully")
 
         if args.is_flatpak:
             print("Comparing Flatpak package lists...")
-            original_packages = parse_flatpak_packages(args.file1)
-            new_packages = parse_flatpak_packages(args.file2)
+            original_packages, new_packages = load_snapshots([args.file1, args.file2], True, args.cache, 1)
             added_packages, removed_packages = compare_package_lists(
                 original_packages, new_packages, "app_id"
         )
         else:
             print("Comparing Fedora package lists...")
-            original_packages = parse_fedora_packages(args.file1)
-            new_packages = parse_fedora_packages(args.file2)
+            original_packages, new_packages = load_snapshots([args.file1, args.file2], False, args.cache, 1)
             added_packages, removed_packages = compare_package_lists(
                 original_packages, new_packages, "name"
             )
+            version_changes = compare_package_versions(original_packages, new_packages)
 
 
         print("Added Packages..: " + format(len(added_packages)))
         print("Removed Packages: " + format(len(removed_packages)))
-        # Create temporary files for added and removed packages
-        
-        # Create temporary file for added packages
-        if args.is_flatpak:
-            command = "flatpak install "
-        else:
-            command = "dnf --skip-unavailable install "
-        with tempfile.NamedTemporaryFile(mode='w', suffix='_added_packages.txt', delete=False) as added_file:
-            added_file_path = added_file.name
-            for pkg in added_packages:
-                command += f"{pkg} "
-            added_file.write(f"{command}\n")
-        
-        # Create temporary file for removed packages
-        if args.is_flatpak:
-            command = "flatpak install "
-        else:
-            command = "dnf --skip-unavailable install "
-        with tempfile.NamedTemporaryFile(mode='w', suffix='_removed_packages.txt', delete=False) as removed_file:
-            removed_file_path = removed_file.name
-            for pkg in removed_packages:
-                command += f"{pkg} "
-            removed_file.write(f"{command}\n")
-        
-        print(f"Added packages written to: {added_file_path}")
-        print(f"Removed packages written to: {removed_file_path}")
+        limit = argument_limit()
+        scripts = [("install", sorted(added_packages), args.install_script, "_added_packages.sh"),
+                   ("remove", sorted(removed_packages), args.remove_script, "_removed_packages.sh")]
+        failed = 0
+        for action, packages, path, suffix in scripts:
+            command = package_command(args.is_flatpak, action, args.yes)
+            batches = list(batch_packages(command, packages, limit))
+            if args.dry_run:
+                print(f"Would {action} {len(packages)} packages in {len(batches)} batches of "
+                      f"'{' '.join(command)}' ({limit} argument bytes per batch)")
+                continue
+            if not batches:
+                continue
+            path = emit_script(path, suffix, command, batches)
+            print(f"{action.capitalize()} script ({len(batches)} batches) written to: {path}")
+            if args.run and not failed:
+                failed = run_batches(command, batches)
+
+        if not args.is_flatpak:
+            print("Upgraded........: " + format(len(version_changes[UPGRADED])))
+            print("Downgraded......: " + format(len(version_changes[DOWNGRADED])))
+            print("Rebuilt.........: " + format(len(version_changes[REBUILT])))
+            with tempfile.NamedTemporaryFile(mode='w', suffix='_changed_packages.txt', delete=False) as changed_file:
+                changed_file_path = changed_file.name
+                for kind, entries in version_changes.items():
+                    for full_name, old, new in entries:
+                        changed_file.write(f"{kind}\t{full_name}\t{old}\t{new}\n")
+            print(f"Version changes written to: {changed_file_path}")
+
+        if failed:
+            print(f"Package manager failed with exit code {failed}", file=sys.stderr)
+            sys.exit(failed)
 
 
     except FileNotFoundError as e:
@@ -205,6 +854,9 @@ def main():
     except IOError as e:
         print(f"Error reading file: {e}", file=sys.stderr)
         sys.exit(1)
+    except ValueError as e:
+        print(f"Error parsing file: {e}", file=sys.stderr)
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -1,27 +1,119 @@
 # extract_doc_info.py
+#
+# Batch PDF metadata extraction for ingestion jobs.
+#
+# Paths come from the command line (files, directories or glob patterns)
+# or one per line on stdin, are processed on a single worker pool and
+# written as CSV or JSON Lines through a large output buffer.
+#
+#   python extract_doc_info.py ~/Books "~/Papers/**/*.pdf" -o books.csv
+#   find /data -name "*.pdf" | python extract_doc_info.py --format jsonl
+#
 
-from PyPDF2 import PdfFileReader
+import os
+import sys
+import csv
+import glob
+import json
+import argparse
+from folderscan import scan_files
+from pdforganized import extract_information as read_information
+from taskpool import TaskPool
+
+FIELDS = ["author", "creator", "producer", "subject", "title"]
+COLUMNS = ["path"] + FIELDS + ["pages", "error"]
+PDF_TIMEOUT = 60
+OUTPUT_BUFFER = 1024 * 1024
+NO_INFO = "no info" # status of documents without an Info dictionary, not an error here
 
 def extract_information(pdf_path):
-    with open(pdf_path, 'rb') as f:
-        pdf = PdfFileReader(f)
-        information = pdf.getDocumentInfo()
-        number_of_pages = pdf.getNumPages()
-
-    txt = f"""
-    Information about {pdf_path}: 
-
-    Author: {information.author}
-    Creator: {information.creator}
-    Producer: {information.producer}
-    Subject: {information.subject}
-    Title: {information.title}
-    Number of pages: {number_of_pages}
     """
+    Return (information, number_of_pages, error), information always has
+    all FIELDS and error is None or "<status>: <message>" with the status
+    pdforganized gives the file (encrypted, corrupt, io, unknown)
+    """
+    information, number_of_pages = read_information(pdf_path)
+    error = None
+    if information.get("error") == NO_INFO:
+        information = {}
+    elif "error" in information:
+        error = "{}: {}".format(information["error"], information.get("message"))
+        information = {}
+    return {field: information.get(field) for field in FIELDS}, number_of_pages, error
+
+def iterPaths(sources, types=(".pdf",)):
+    """ Expand files, directories and glob patterns, '-' reads paths from stdin """
+    seen = set()
+    for source in sources:
+        if source == "-":
+            candidates = (line.rstrip("\r\n") for line in sys.stdin)
+        elif os.path.isdir(source):
+            candidates = (entry.path for entry in scan_files(source, list(types)))
+        elif glob.has_magic(source):
+            candidates = glob.iglob(os.path.expanduser(source), recursive=True)
+        else:
+            candidates = [source]
+        for path in candidates:
+            if path and path not in seen:
+                seen.add(path)
+                yield path
+
+def iterRecords(sources, jobs=None, timeout=PDF_TIMEOUT):
+    """ Yield one row per file in completion order """
+    pool = TaskPool(extract_information, jobs, timeout)
+    for result in pool.run(iterPaths(sources)):
+        row = dict.fromkeys(COLUMNS)
+        row["path"] = result.item
+        if result.failure:
+            row["error"] = "{}: {}".format(result.failure, result.message)
+        else:
+            information, row["pages"], row["error"] = result.value
+            row.update(information)
+        yield row
+
+def writeRecords(records, stream, outputFormat="csv"):
+    """ Write records to stream, returns (total, failed) """
+    total = failed = 0
+    if outputFormat == "csv":
+        writer = csv.DictWriter(stream, fieldnames=COLUMNS)
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        write = lambda record: stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+    for record in records:
+        write(record)
+        total += 1
+        if record["error"]:
+            failed += 1
+    return total, failed
+
+def guessFormat(output):
+    if output and output.lower().endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return "csv"
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract PDF metadata from many files as CSV or JSON Lines.")
+    parser.add_argument("sources", nargs="*", default=["-"],
+        help="PDF files, folders or glob patterns, '-' reads one path per line from stdin (default).")
+    parser.add_argument("-o", "--output",
+        help="output file (default: stdout).")
+    parser.add_argument("--format", choices=["csv", "jsonl"],
+        help="output format (default: from the output extension, csv otherwise).")
+    parser.add_argument("--jobs", type=int, default=None,
+        help="number of worker processes (default: CPU count).")
+    parser.add_argument("--timeout", type=float, default=PDF_TIMEOUT,
+        help="seconds a single file may take (default: {}).".format(PDF_TIMEOUT))
+    args = parser.parse_args()
 
-    print(txt)
-    return information
+    outputFormat = args.format or guessFormat(args.output)
+    if args.output:
+        stream = open(args.output, "w", encoding="utf-8", newline="", buffering=OUTPUT_BUFFER)
+    else:
+        stream = open(sys.stdout.fileno(), "w", encoding="utf-8", newline="", buffering=OUTPUT_BUFFER, closefd=False)
+    with stream:
+        total, failed = writeRecords(iterRecords(args.sources, args.jobs, args.timeout), stream, outputFormat)
+    print("{} files, {} failed.".format(total, failed), file=sys.stderr)
 
 if __name__ == '__main__':
-    path = '/mnt/win10ssd/Users/lauri/Google Drive/Pessoal/RPG/Dungeon_World2.pdf'
-    extract_information(path)
\ No newline at end of file
+    main()
@@ -0,0 +1,131 @@
+# MIT License
+
+# Copyright (c) 2020 Lauri P. Laux Jr
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#
+# Single pass, parallel directory scanner shared by the tools.
+#
+# The tree is walked only once with os.scandir and every directory read
+# runs on a thread pool, so the listing of a deep folder does not wait
+# for its siblings. The size, mtime and inode of each file come from
+# the DirEntry, avoiding an extra os.path.getsize call per file.
+#
+
+import os
+
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+SCAN_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+ScanEntry = namedtuple("ScanEntry", ["path", "name", "size", "mtime", "inode"])
+LeafFolder = namedtuple("LeafFolder", ["path", "files"])
+
+
+def scan_files(folder, extensions=None, workers=SCAN_WORKERS, onerror=None):
+    """
+    Walk a folder tree once and yield every regular file found.
+
+    Directory reads are fanned out to a thread pool, but the results are
+    yielded in a stable breadth-first order (entries sorted by name inside
+    each directory) so two runs over the same tree produce the same output.
+
+    Args:
+        folder (str): Root folder to scan
+        extensions (iterable): Only yield files ending with one of these
+            extensions (e.g. [".jpg", ".png"]). None yields every file.
+        workers (int): Number of threads used to read directories
+        onerror (callable): Called with the OSError of a directory that
+            could not be read. Errors are ignored when None, like os.walk.
+
+    Yields:
+        ScanEntry: path, name, size, mtime (ns) and inode of each file
+    """
+    for _, files, _ in _walk(folder, extensions, workers, onerror, False, True):
+        yield from files
+
+
+def scan_leaf_folders(folder, extensions=None, workers=SCAN_WORKERS, onerror=None):
+    """
+    Walk a folder tree once and yield every folder without subfolders
+    (album folders in a music library, for instance).
+
+    Same single pass, thread pool and stable order as scan_files. The root
+    folder itself is yielded when it has no subfolders. Only names are
+    listed: extensions match whatever their case and files are not
+    stat'ed, so size, mtime and inode of the entries are None.
+
+    Args:
+        folder (str): Root folder to scan
+        extensions (iterable): Only list files ending with one of these
+            extensions, in any case. None lists every file.
+        workers (int): Number of threads used to read directories
+        onerror (callable): Called with the OSError of a directory that
+            could not be read. Errors are ignored when None, like os.walk.
+
+    Yields:
+        LeafFolder: path and the ScanEntry list of its files
+    """
+    for path, files, folders in _walk(folder, extensions, workers, onerror, True, False):
+        if not folders:
+            yield LeafFolder(path, files)
+
+
+def _walk(folder, extensions, workers, onerror, ignore_case, stat):
+    if extensions is not None:
+        extensions = tuple(extension.lower() for extension in extensions) if ignore_case else tuple(extensions)
+    read = lambda path: _read_folder(path, extensions, ignore_case, stat)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque([(folder, pool.submit(read, folder))])
+        while pending:
+            path, future = pending.popleft()
+            try:
+                files, folders = future.result()
+            except OSError as error:
+                if onerror is not None:
+                    onerror(error)
+                continue
+            pending.extend((sub, pool.submit(read, sub)) for sub in folders)
+            yield path, files, folders
+
+
+def _read_folder(folder, extensions, ignore_case, stat):
+    files = []
+    folders = []
+    with os.scandir(folder) as entries:
+        for entry in sorted(entries, key=lambda e: e.name):
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.path)
+                elif entry.is_file():
+                    if extensions is not None:
+                        extension = os.path.splitext(entry.name)[-1]
+                        if (extension.lower() if ignore_case else extension) not in extensions:
+                            continue
+                    if stat:
+                        info = entry.stat()
+                        files.append(ScanEntry(entry.path, entry.name, info.st_size, info.st_mtime_ns, info.st_ino))
+                    else:
+                        files.append(ScanEntry(entry.path, entry.name, None, None, None))
+            except OSError:
+                # File vanished or can't be stat'ed between listing and reading
+                continue
+    return files, folders
@@ -0,0 +1,309 @@
+# MIT License
+
+# Copyright (c) 2020 Lauri P. Laux Jr
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#
+# Linux inotify watcher for long running tools, through ctypes so no
+# extra package or service is needed.
+#
+# Every folder of a tree gets a watch. Files that are closed after
+# writing or renamed into the tree are debounced into small batches; a
+# phone sync dropping a hundred photos gives a few batches instead of a
+# hundred single file runs. When the kernel event queue overflows, or a
+# folder can't be watched because the inotify watch limit is reached,
+# events are lost: those folders are then rescanned, looking only at
+# files changed since the last event seen.
+#
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import stat
+import struct
+import time
+
+from folderscan import ScanEntry, scan_files
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+DEBOUNCE = 2.0 # seconds without events before a batch is released
+MAX_WAIT = 30.0 # a busy folder still releases a batch this often
+MAX_BATCH = 256
+POLL_INTERVAL = 60.0 # rescan of folders inotify can't watch
+RESCAN_SLACK = 2.0 # seconds of mtime tolerance of the targeted rescans
+
+
+class WatchError(OSError):
+    pass
+
+
+def _libc():
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise WatchError(errno.ENOSYS, "inotify is not available on this system")
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+class FolderWatch:
+    """
+    Watch a folder tree and yield new files in debounced batches.
+
+    Args:
+        folder (str): Root of the tree to watch
+        extensions (iterable): Only report files ending with one of these
+            extensions, None reports every file
+        exclude (iterable): Folders left out of the watch (e.g. the folder
+            files are moved to, which may live inside the tree)
+        debounce (float): Seconds without new events before a batch is
+            released
+        max_batch (int): Batch size released without waiting
+    """
+
+    def __init__(self, folder, extensions=None, exclude=(), debounce=DEBOUNCE, max_batch=MAX_BATCH):
+        self.folder = os.path.abspath(folder)
+        self.extensions = tuple(extensions) if extensions is not None else None
+        self.exclude = {os.path.abspath(path) for path in exclude if path}
+        self.debounce = debounce
+        self.max_batch = max_batch
+        self.overflows = 0
+        self._libc = _libc()
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise WatchError(error, "inotify_init1: {}".format(os.strerror(error)))
+        self._watches = {}
+        self._unwatched = set()
+        self._pending = {}
+        self._first_pending = None
+        self._last_pending = None
+        self._last_event = time.time()
+        self._last_poll = time.time()
+        self._buffer = b""
+        self._watch_tree(self.folder)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    @property
+    def watched(self):
+        """Number of folders with an inotify watch."""
+        return len(self._watches)
+
+    @property
+    def unwatched(self):
+        """Folders polled because the inotify watch limit was reached."""
+        return sorted(self._unwatched)
+
+    def batches(self, timeout=None):
+        """
+        Yield lists of ScanEntry for files written or moved into the tree.
+
+        Args:
+            timeout (float): Stop after this many seconds, None runs until
+                the caller stops iterating
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while deadline is None or time.monotonic() < deadline:
+            wait = self._next_wakeup(deadline)
+            ready, _, _ = select.select([self._fd], [], [], wait)
+            if ready:
+                self._read_events()
+            if self._unwatched and time.time() - self._last_poll >= POLL_INTERVAL:
+                since, self._last_poll = self._last_poll, time.time()
+                for folder in list(self._unwatched):
+                    self._rescan(folder, since - RESCAN_SLACK)
+                    # Watches may have been freed since, try again
+                    self._watch_tree(folder)
+            batch = self._release()
+            if batch:
+                yield batch
+        while self._pending:
+            batch = self._release(force=True)
+            if batch:
+                yield batch
+
+    def _next_wakeup(self, deadline):
+        now = time.monotonic()
+        wakeups = [now + POLL_INTERVAL]
+        if self._pending:
+            wakeups.append(min(self._last_pending + self.debounce, self._first_pending + MAX_WAIT))
+        if deadline is not None:
+            wakeups.append(deadline)
+        return max(0.0, min(wakeups) - now)
+
+    def _watch_tree(self, folder, rescan=False):
+        """
+        Watch folder and all its subfolders. With rescan, files already in
+        them are reported too: they may have landed before the watch did.
+        """
+        for path, folders, files in os.walk(folder):
+            if self._excluded(path):
+                folders[:] = []
+                continue
+            folders[:] = [name for name in folders if not self._excluded(os.path.join(path, name))]
+            self._add_watch(path)
+            if rescan:
+                for name in files:
+                    self._add_pending(os.path.join(path, name))
+
+    def _add_watch(self, folder):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(folder), WATCH_MASK)
+        if wd >= 0:
+            self._watches[wd] = folder
+            self._unwatched.discard(folder)
+            return
+        error = ctypes.get_errno()
+        if error == errno.ENOSPC:
+            # fs.inotify.max_user_watches reached, poll this one instead
+            self._unwatched.add(folder)
+        elif error not in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+            raise WatchError(error, "inotify_add_watch {}: {}".format(folder, os.strerror(error)))
+
+    def _excluded(self, path):
+        return any(path == folder or path.startswith(folder + os.sep) for folder in self.exclude)
+
+    def _read_events(self):
+        try:
+            data = os.read(self._fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        self._buffer += data
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(self._buffer):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(self._buffer, offset)
+            end = offset + EVENT_HEADER.size + length
+            if end > len(self._buffer):
+                break
+            name = self._buffer[offset + EVENT_HEADER.size:end].rstrip(b"\0")
+            offset = end
+            self._handle(wd, mask, os.fsdecode(name))
+        self._buffer = self._buffer[offset:]
+
+    def _handle(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            # Events were dropped, look at everything touched since the last one
+            self.overflows += 1
+            self._rescan(self.folder, self._last_event - RESCAN_SLACK)
+            return
+        self._last_event = time.time()
+        folder = self._watches.get(wd)
+        if mask & IN_IGNORED:
+            self._watches.pop(wd, None)
+            return
+        if folder is None or mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            return
+        path = os.path.join(folder, name)
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO) and not self._excluded(path):
+                self._watch_tree(path, rescan=True)
+        elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+            self._add_pending(path)
+
+    def _rescan(self, folder, since):
+        """
+        Queue the files under folder changed after since (epoch seconds).
+        The ctime is checked too: sync tools keep the original mtime of the
+        files they copy, but creating or renaming a file always sets ctime.
+        """
+        since_ns = int(since * 1e9)
+        for entry in scan_files(folder, self.extensions):
+            if self._excluded(os.path.dirname(entry.path)):
+                continue
+            if entry.mtime < since_ns:
+                try:
+                    if os.stat(entry.path).st_ctime_ns < since_ns:
+                        continue
+                except OSError:
+                    continue
+            self._add_pending(entry.path)
+        # Folders created while events were lost have no watch yet
+        if folder == self.folder:
+            known = set(self._watches.values())
+            for path, folders, _ in os.walk(folder):
+                folders[:] = [name for name in folders if not self._excluded(os.path.join(path, name))]
+                if path not in known and path not in self._unwatched:
+                    self._add_watch(path)
+
+    def _add_pending(self, path):
+        if self.extensions is not None and os.path.splitext(path)[-1] not in self.extensions:
+            return
+        now = time.monotonic()
+        if not self._pending:
+            self._first_pending = now
+        self._pending[path] = now
+        self._last_pending = now
+
+    def _release(self, force=False):
+        if not self._pending:
+            return None
+        now = time.monotonic()
+        if not (force or len(self._pending) >= self.max_batch
+                or now - self._last_pending >= self.debounce
+                or now - self._first_pending >= MAX_WAIT):
+            return None
+        paths = list(self._pending)[:self.max_batch]
+        for path in paths:
+            del self._pending[path]
+        if self._pending:
+            self._first_pending = now
+        batch = []
+        for path in paths:
+            entry = _entry(path)
+            if entry is not None:
+                batch.append(entry)
+        return batch
+
+
+def _entry(path):
+    try:
+        info = os.stat(path)
+    except OSError:
+        # Gone already (temporary file renamed away, deleted)
+        return None
+    if not stat.S_ISREG(info.st_mode):
+        return None
+    return ScanEntry(path, os.path.basename(path), info.st_size, info.st_mtime_ns, info.st_ino)
+
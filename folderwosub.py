@@ -35,68 +35,97 @@ import os
 import json
 import argparse
 import pathlib
+import tempfile
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
-from progress.bar import Bar
 from progress.spinner import Spinner
-from mp3_tagger import MP3File, VERSION_1, VERSION_2, VERSION_BOTH
+from folderscan import scan_leaf_folders
+from id3tags import read_tags
+
+MP3_EXTENSIONS = [".mp3"] # any case
+TAG_WORKERS = 16
+TAG_BATCH = 64
 
 def findMp3Artist(file):
-    mp3 = MP3File(file)
-    tags = "empty"
-    try:
-        tags = mp3.get_tags()
-    except UnicodeDecodeError as err:
-        print("\nError retreiving tags, file: {} - error: {}".format(path, err.reason))
-    except:
-        print("\nBad MP3 tags , file: {}".format(path))
     artist = "empty"
-    if tags['ID3TagV2'] and tags['ID3TagV2']['artist']:
-        artist = tags['ID3TagV2']['artist']
-    print(" -> {}".format(artist))
+    try:
+        artist = read_tags(file).artist or artist
+    except Exception as err:
+        print("\nBad MP3 tags , file: {} - error: {}".format(file, err))
     return artist
 
+def findArtists(leaves):
+    """ Artist of the first MP3 (by name) of each leaf folder, runs on the tag workers """
+    return [{"folder": leaf.path, "artist": findMp3Artist(leaf.files[0].path)} for leaf in leaves]
 
 def findAllFolders(folder):
-    folders = [f.path for f in os.scandir(folder) if f.is_dir()]
-    print("\nFound {} folders.".format(len(folders)))
-    return folders
+    """ Yield the folders without subfolders, at any depth, that have MP3 files """
+    return (leaf for leaf in scan_leaf_folders(folder, MP3_EXTENSIONS) if leaf.files)
 
-def main(folder):
-    foundFolderList = []
-    folders = findAllFolders(folder)
-    for folder in folders:
-        subFolders = [f.path for f in os.scandir(folder) if f.is_dir()]
-        if len(subFolders) == 0:
-            print("Found folder: '{}'".format(folder))
-            files = [f.path for f in os.scandir(folder) if f.is_file() and ".mp3" in f.name]
-            if len(files) > 0:
-                artist = findMp3Artist(files[0])
-                foundFolderList.append({"folder": folder, "artist": artist})
-    return foundFolderList
+def main(folder, logFile, workers=TAG_WORKERS):
+    """
+    Look up the artist of every album folder and write the results to
+    logFile as a JSON array, one entry at a time as batches complete.
+    Batches are written in scan order and at most workers * 2 of them are
+    in flight, so memory stays flat on big libraries. The array goes to a
+    temporary file renamed to logFile when something was found, an
+    existing logFile is left alone otherwise.
+    """
+    found = 0
+    spinner = Spinner("-> Mapping album folders ")
+    leaves = findAllFolders(folder)
+    handle, tempFile = tempfile.mkstemp(dir=os.path.dirname(logFile) or ".", suffix=".tmp")
+    try:
+        with open(handle, "w", encoding="utf-8") as log_file, ThreadPoolExecutor(max_workers=workers) as pool:
+            log_file.write("[")
+            pending = deque()
+            while True:
+                while len(pending) < workers * 2:
+                    batch = list(islice(leaves, TAG_BATCH))
+                    if not batch:
+                        break
+                    pending.append(pool.submit(findArtists, batch))
+                if not pending:
+                    break
+                for entry in pending.popleft().result():
+                    log_file.write(",\n" if found else "\n")
+                    json.dump(entry, log_file)
+                    found += 1
+                    spinner.next()
+            log_file.write("\n]\n" if found else "]\n")
+        if found:
+            os.replace(tempFile, logFile)
+    finally:
+        if os.path.exists(tempFile):
+            os.remove(tempFile)
+    spinner.finish()
+    return found
 
 def find_folders_without_subfolders():
     folder = args.folder
-    logFile = args.logfile
+    logFile = os.path.join(pathlib.Path().absolute(), args.logfile)
     print("\n{}".format(parser.description))
     print("Folder: '{}'".format(folder))
     print("Log file: '{}'".format(logFile))
-    foundFolderList = main(folder)
-    if len(foundFolderList) > 0:
-        with open(os.path.join(pathlib.Path().absolute(), logFile), "w+") as log_file:
-            json.dump(foundFolderList, log_file)
+    found = main(folder, logFile, args.jobs)
+    if found > 0:
+        print("\nFound {} folders without subfolders.".format(found))
     else:
         print("No folders without subfolders found.\n")
-    pass
 
 if __name__=="__main__":
-    parser = argparse.ArgumentParser(description="Folder Without SubFolders - v0.1")
+    parser = argparse.ArgumentParser(description="Folder Without SubFolders - v0.2")
     parser.add_argument("folder", metavar="folder", type=str, 
         help="folder to search.")
     parser.add_argument("logfile", metavar="logfile", type=str, 
         help="log file where the results are kept.")
+    parser.add_argument("--jobs", type=int, default=TAG_WORKERS,
+        help="threads reading MP3 tags (default: {}).".format(TAG_WORKERS))
     args = parser.parse_args()
     if not args.folder or not args.logfile:
         parser.print_help()
     else:
-        find_folders_without_subfolders()
\ No newline at end of file
+        find_folders_without_subfolders()
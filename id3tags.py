@@ -0,0 +1,195 @@
+# MIT License
+
+# Copyright (c) 2020 Lauri P. Laux Jr
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#
+# Lean ID3 tag reader for bulk scans.
+#
+# Only the ID3v2 header plus the frames the tools use (title, track and
+# artist) and the 128 byte ID3v1 tail are read, with bounded reads and
+# memoryview slices instead of parsing every frame of every tag. When
+# pytaglib is installed it can be used as an alternative backend.
+#
+
+import os
+import struct
+
+from collections import namedtuple
+
+try:
+    import taglib
+except ImportError:
+    taglib = None
+
+MAX_TAG_READ = 256 * 1024 # ID3v2 bytes read looking for the frames
+ID3V1_SIZE = 128
+
+Tags = namedtuple("Tags", ["title", "track", "artist"])
+
+# ID3v2.2 uses 3 character frame ids, v2.3 and v2.4 use 4
+FRAMES = {
+    b"TIT2": "title", b"TRCK": "track", b"TPE1": "artist",
+    b"TT2": "title", b"TRK": "track", b"TP1": "artist",
+}
+TEXT_ENCODINGS = {0: "latin-1", 1: "utf-16", 2: "utf-16-be", 3: "utf-8"}
+
+
+def read_tags(path, backend="id3"):
+    """
+    Read title, track and artist of an MP3 file.
+
+    ID3v2 values win over ID3v1 ones, missing values are None.
+
+    Args:
+        path (str): MP3 file
+        backend (str): "id3" for the built-in reader, "taglib" for pytaglib
+
+    Returns:
+        Tags: title, track and artist
+    """
+    return BACKENDS[backend](path)
+
+
+def available_backends():
+    return [name for name in BACKENDS if name != "taglib" or taglib is not None]
+
+
+def read_id3_tags(path):
+    with open(path, "rb") as f:
+        head = f.read(10)
+        values = {}
+        if len(head) == 10 and head[:3] == b"ID3":
+            size = _syncsafe(head[6:10])
+            values = _parse_id3v2(head, f.read(min(size, MAX_TAG_READ)))
+        if len(values) < 3:
+            size = f.seek(0, os.SEEK_END)
+            if size >= ID3V1_SIZE:
+                f.seek(size - ID3V1_SIZE)
+                for key, value in _parse_id3v1(f.read(ID3V1_SIZE)).items():
+                    values.setdefault(key, value)
+    return Tags(values.get("title"), values.get("track"), values.get("artist"))
+
+
+def read_taglib_tags(path):
+    if taglib is None:
+        raise RuntimeError("pytaglib is not installed")
+    with taglib.File(path) as song:
+        tags = song.tags
+    first = lambda key: tags[key][0] if tags.get(key) else None
+    return Tags(first("TITLE"), first("TRACKNUMBER"), first("ARTIST"))
+
+
+BACKENDS = {"id3": read_id3_tags, "taglib": read_taglib_tags}
+
+
+def audio_bounds(path, size):
+    """
+    Return the (start, end) offsets of the audio frames of an MP3 file,
+    skipping ID3v2, ID3v1 and APEv2 tags.
+    """
+    with open(path, "rb") as f:
+        start = 0
+        head = f.read(10)
+        if len(head) == 10 and head[:3] == b"ID3":
+            start = 10 + _syncsafe(head[6:10]) + (10 if head[5] & 0x10 else 0)
+        end = size
+        if size >= ID3V1_SIZE:
+            f.seek(size - ID3V1_SIZE)
+            if f.read(3) == b"TAG":
+                end -= ID3V1_SIZE
+        if end - start >= 32:
+            f.seek(end - 32)
+            footer = f.read(32)
+            if footer[:8] == b"APETAGEX":
+                tag_size = int.from_bytes(footer[12:16], "little")
+                flags = int.from_bytes(footer[20:24], "little")
+                end -= tag_size + (32 if flags & 0x80000000 else 0)
+    return start, max(start, end)
+
+
+def _syncsafe(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _parse_id3v2(head, data):
+    version = head[3]
+    flags = head[5]
+    if flags & 0x80 and version < 4:
+        # Tag level unsynchronisation, v2.4 does it per frame
+        data = data.replace(b"\xff\x00", b"\xff")
+    tag = memoryview(data)
+    pos = 0
+    if flags & 0x40:
+        # Skip the extended header
+        if version == 3:
+            pos = 4 + struct.unpack_from(">I", tag, 0)[0]
+        elif version == 4:
+            pos = _syncsafe(tag[0:4])
+    id_size, header_size = (3, 6) if version == 2 else (4, 10)
+    values = {}
+    while pos + header_size <= len(tag) and len(values) < 3:
+        frame_id = bytes(tag[pos:pos + id_size])
+        if frame_id[0] == 0:
+            # Padding
+            break
+        if version == 2:
+            size = int.from_bytes(tag[pos + 3:pos + 6], "big")
+        elif version == 4:
+            size = _syncsafe(tag[pos + 4:pos + 8])
+        else:
+            size = struct.unpack_from(">I", tag, pos + 4)[0]
+        body = tag[pos + header_size:pos + header_size + size]
+        if version == 4:
+            frame_flags = tag[pos + 9]
+            if frame_flags & 0x01:
+                # Data length indicator
+                body = body[4:]
+            if frame_flags & 0x02:
+                body = memoryview(bytes(body).replace(b"\xff\x00", b"\xff"))
+        key = FRAMES.get(frame_id)
+        if key and key not in values and len(body) > 0:
+            text = _decode_text(body)
+            if text:
+                values[key] = text
+        pos += header_size + size
+    return values
+
+
+def _decode_text(body):
+    encoding = TEXT_ENCODINGS.get(body[0], "latin-1")
+    raw = bytes(body[1:])
+    try:
+        text = raw.decode(encoding)
+    except UnicodeDecodeError:
+        text = raw.decode("latin-1")
+    # v2.4 may hold several null separated values, keep the first
+    return text.split("\x00", 1)[0].strip()
+
+
+def _parse_id3v1(data):
+    if len(data) < ID3V1_SIZE or data[:3] != b"TAG":
+        return {}
+    field = lambda start, end: data[start:end].split(b"\x00", 1)[0].decode("latin-1").strip()
+    values = {"title": field(3, 33), "artist": field(33, 63)}
+    if data[125] == 0 and data[126] != 0:
+        # ID3v1.1 keeps the track number in the last comment byte
+        values["track"] = str(data[126])
+    return {key: value for key, value in values.items() if value}
@@ -0,0 +1,207 @@
+# MIT License
+
+# Copyright (c) 2020 Lauri P. Laux Jr
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#
+# Header only probes for image files.
+#
+# These helpers look at the first few KB of an image and walk the
+# container structure by hand, so questions like "does this JPEG have
+# EXIF?" are answered without handing the whole file to a full parser.
+# A probe returns None when it can't decide and the caller should fall
+# back to the slow path.
+#
+# Image dimensions come from the PNG IHDR chunk or the JPEG SOFn marker.
+# The JPEG walk seeks over the segments in front of SOFn (EXIF and its
+# thumbnail can take tens of KB) instead of reading them, so it usually
+# costs one or two reads of a few hundred bytes.
+#
+
+import struct
+
+from collections import namedtuple
+
+PROBE_SIZE = 16 * 1024
+DIMENSION_READ = 512
+MAX_SEGMENTS = 64
+
+JPEG_SOI = b"\xff\xd8"
+EXIF_HEADER = b"Exif\x00\x00"
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+# Markers without a length field
+STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7}
+MARKER_SOS = 0xDA
+MARKER_EOI = 0xD9
+MARKER_APP1 = 0xE1
+# Start of frame markers, all but DHT (C4), JPG (C8) and DAC (CC)
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+ExifProbe = namedtuple("ExifProbe", ["has_exif", "make", "model"])
+ImageSize = namedtuple("ImageSize", ["width", "height"])
+
+
+def probe_exif(path, probe_size=PROBE_SIZE):
+    """
+    Find out if a JPEG carries an EXIF segment reading only its header.
+
+    Args:
+        path (str): Image file
+        probe_size (int): Maximum number of bytes read from the file
+
+    Returns:
+        ExifProbe: has_exif plus camera make/model (None when absent), or
+            None if the file is not a JPEG or the probe is inconclusive
+    """
+    with open(path, "rb") as f:
+        data = f.read(probe_size)
+    return probe_exif_bytes(data)
+
+
+def probe_exif_bytes(data):
+    data = memoryview(data)
+    if bytes(data[:2]) != JPEG_SOI:
+        return None
+    pos = 2
+    end = len(data)
+    while pos + 4 <= end:
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before the real marker
+            pos += 1
+            continue
+        if marker in STANDALONE_MARKERS:
+            pos += 2
+            continue
+        if marker in (MARKER_SOS, MARKER_EOI):
+            # Image data starts, metadata segments can't follow
+            return ExifProbe(False, None, None)
+        length = struct.unpack_from(">H", data, pos + 2)[0]
+        if length < 2:
+            return None
+        segment = data[pos + 4:pos + 2 + length]
+        if marker == MARKER_APP1 and bytes(segment[:6]) == EXIF_HEADER:
+            return _probe_tiff(segment[6:])
+        pos += 2 + length
+    return None
+
+
+def _probe_tiff(tiff):
+    byte_order = bytes(tiff[:4])
+    if byte_order == b"II*\x00":
+        endian = "<"
+    elif byte_order == b"MM\x00*":
+        endian = ">"
+    else:
+        return None
+    make = None
+    model = None
+    try:
+        ifd = struct.unpack_from(endian + "I", tiff, 4)[0]
+        count = struct.unpack_from(endian + "H", tiff, ifd)[0]
+        for i in range(count):
+            tag, kind, length, value = struct.unpack_from(endian + "HHI4s", tiff, ifd + 2 + i * 12)
+            if tag not in (TAG_MAKE, TAG_MODEL) or kind != 2:
+                continue
+            if length <= 4:
+                raw = value[:length]
+            else:
+                offset = struct.unpack(endian + "I", value)[0]
+                raw = bytes(tiff[offset:offset + length])
+            text = raw.split(b"\x00", 1)[0].decode("ascii", "replace").strip() or None
+            if tag == TAG_MAKE:
+                make = text
+            else:
+                model = text
+    except struct.error:
+        # IFD0 lies outside the probed bytes, the segment itself is enough
+        pass
+    return ExifProbe(True, make, model)
+
+
+def probe_dimensions(path):
+    """
+    Read the pixel size of a PNG or JPEG from its header only.
+
+    Args:
+        path (str): Image file
+
+    Returns:
+        ImageSize: width and height, or None if the file is neither a PNG
+            nor a JPEG or its header is damaged
+    """
+    with open(path, "rb") as f:
+        reader = _SeekReader(f)
+        head = reader.read(0, 24)
+        if head[:8] == PNG_SIGNATURE:
+            if head[12:16] != b"IHDR":
+                return None
+            return ImageSize(*struct.unpack_from(">II", head, 16))
+        if head[:2] == JPEG_SOI:
+            return _jpeg_dimensions(reader)
+    return None
+
+
+def _jpeg_dimensions(reader):
+    pos = 2
+    for _ in range(MAX_SEGMENTS):
+        head = reader.read(pos, 9)
+        if len(head) < 4 or head[0] != 0xFF:
+            return None
+        marker = head[1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in STANDALONE_MARKERS:
+            pos += 2
+            continue
+        if marker in (MARKER_SOS, MARKER_EOI):
+            return None
+        if marker in SOF_MARKERS:
+            if len(head) < 9:
+                return None
+            height, width = struct.unpack_from(">HH", head, 5)
+            # A zero height is only known after the scan (DNL), give up
+            return ImageSize(width, height) if width and height else None
+        length = struct.unpack_from(">H", head, 2)[0]
+        if length < 2:
+            return None
+        pos += 2 + length
+    return None
+
+
+class _SeekReader:
+    """ Reads small windows of a file, reusing the last read when it covers the request """
+
+    def __init__(self, f):
+        self.f = f
+        self.base = 0
+        self.data = b""
+
+    def read(self, pos, size):
+        if pos < self.base or pos + size > self.base + len(self.data):
+            self.f.seek(pos)
+            self.base = pos
+            self.data = self.f.read(max(size, DIMENSION_READ))
+        return self.data[pos - self.base:pos - self.base + size]
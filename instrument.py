@@ -0,0 +1,327 @@
+# MIT License
+
+# Copyright (c) 2020 Lauri P. Laux Jr
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#
+# Run instrumentation shared by the tools.
+#
+# Stage timers, counters and per file latency samples are collected in
+# one Stats object per run and written as a JSON report by --profile.
+# Nothing is collected unless a run enables it: stats() then returns a
+# stand in whose methods do nothing, and timed() hands back the function
+# it was given, so the normal path pays for a single attribute lookup.
+#
+# Per file work often runs on worker processes or threads. timed() wraps
+# such a function so each call returns a TimedResult carrying its own
+# Sample (wall time and bytes read by the calling thread, from
+# /proc/thread-self/io where available); unwrap() in the parent records
+# the sample and returns the plain value.
+#
+
+import cProfile
+import heapq
+import io
+import json
+import os
+import pstats
+import time
+
+from array import array
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+TOP_FILES = 20
+TOP_FUNCTIONS = 30
+# Upper bounds of the latency histogram buckets, in milliseconds
+HISTOGRAM_BOUNDS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+THREAD_IO = "/proc/thread-self/io"
+
+Sample = namedtuple("Sample", ["stage", "path", "seconds", "bytes_read"])
+TimedResult = namedtuple("TimedResult", ["value", "sample"])
+
+_active = None
+_overhead = None
+
+
+class Stats:
+    """
+    Collects the measurements of one run.
+
+    Args:
+        tool (str): Name of the tool, written in the report
+        cprofile (bool): Also run cProfile on this process
+        top (int): Number of slowest files kept per stage
+    """
+
+    def __init__(self, tool, cprofile=False, top=TOP_FILES):
+        self.tool = tool
+        self.top = top
+        self.started = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self._stages = {}
+        self._counters = Counter()
+        self._files = {}
+        self._profile = cProfile.Profile() if cprofile else None
+        if self._profile is not None:
+            self._profile.enable()
+
+    @contextmanager
+    def stage(self, name):
+        """ Time a block of work, nested and repeated stages add up """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        totals = self._stages.setdefault(name, [0.0, 0])
+        totals[0] += seconds
+        totals[1] += 1
+
+    def count(self, name, amount=1):
+        self._counters[name] += amount
+
+    def sample(self, sample):
+        """ Record the latency (and bytes read) of one file """
+        files = self._files.get(sample.stage)
+        if files is None:
+            files = self._files[sample.stage] = _FileStats(self.top)
+        files.add(sample)
+
+    def report(self):
+        report = {
+            "tool": self.tool,
+            "started": self.started.isoformat(timespec="seconds"),
+            "wall_seconds": round(time.perf_counter() - self._start, 3),
+            "stages": {name: {"seconds": round(seconds, 3), "calls": calls}
+                for name, (seconds, calls) in self._stages.items()},
+            "counters": dict(self._counters),
+            "files": {stage: files.report() for stage, files in self._files.items()},
+        }
+        if self._profile is not None:
+            self._profile.disable()
+            report["cprofile"] = _top_functions(self._profile)
+        return report
+
+    def write(self, path):
+        """ Write the JSON report, plus the raw cProfile data to path.prof """
+        report = self.report()
+        if self._profile is not None:
+            self._profile.dump_stats(path + ".prof")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        return report
+
+
+class _FileStats:
+
+    def __init__(self, top):
+        self.top = top
+        self.latencies = array("d")
+        self.bytes_read = 0
+        self.measured = 0
+        self.slowest = []
+
+    def add(self, sample):
+        self.latencies.append(sample.seconds)
+        if sample.bytes_read is not None:
+            self.bytes_read += sample.bytes_read
+            self.measured += 1
+        entry = (sample.seconds, sample.path, sample.bytes_read)
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, entry)
+        elif entry[0] > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def report(self):
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+        buckets = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        bound = 0
+        for seconds in latencies:
+            while bound < len(HISTOGRAM_BOUNDS) and seconds * 1000 > HISTOGRAM_BOUNDS[bound]:
+                bound += 1
+            buckets[bound] += 1
+        percentile = lambda p: round(latencies[min(count - 1, int(p * count))] * 1000, 3) if count else None
+        return {
+            "count": count,
+            "seconds": round(sum(latencies), 3),
+            "mean_ms": round(sum(latencies) / count * 1000, 3) if count else None,
+            "p50_ms": percentile(0.5),
+            "p90_ms": percentile(0.9),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(latencies[-1] * 1000, 3) if count else None,
+            "bytes_read": self.bytes_read if self.measured else None,
+            "mean_bytes_read": self.bytes_read // self.measured if self.measured else None,
+            "histogram": [{"le_ms": le, "count": n} for le, n in zip(HISTOGRAM_BOUNDS + [None], buckets)],
+            "slowest": [{"path": path, "ms": round(seconds * 1000, 3), "bytes_read": read}
+                for seconds, path, read in sorted(self.slowest, reverse=True)],
+        }
+
+
+class _Disabled:
+    """ Stand in for Stats when no report was asked for """
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def add_time(self, name, seconds):
+        pass
+
+    def count(self, name, amount=1):
+        pass
+
+    def sample(self, sample):
+        pass
+
+
+_DISABLED = _Disabled()
+
+
+def enable(tool, cprofile=False):
+    """ Start collecting for this run and return the Stats """
+    global _active
+    _active = Stats(tool, cprofile)
+    return _active
+
+
+def stats():
+    """ The Stats of the run, or a stand in doing nothing """
+    return _active if _active is not None else _DISABLED
+
+
+def enabled():
+    return _active is not None
+
+
+def finish(path):
+    """ Write the report of the run to path and stop collecting """
+    global _active
+    if _active is None:
+        return None
+    report = _active.write(path)
+    _active = None
+    return report
+
+
+class Timed:
+    """
+    Picklable wrapper that makes function(item) return a TimedResult. The
+    sample path is item itself when it is a str, else item.path.
+    """
+
+    def __init__(self, function, stage):
+        self.function = function
+        self.stage = stage
+
+    def __call__(self, item, *args, **kwargs):
+        before = _thread_bytes_read()
+        start = time.perf_counter()
+        value = self.function(item, *args, **kwargs)
+        seconds = time.perf_counter() - start
+        after = _thread_bytes_read()
+        read = max(0, after - before - _read_overhead()) if before is not None and after is not None else None
+        path = item if isinstance(item, str) else getattr(item, "path", repr(item))
+        return TimedResult(value, Sample(self.stage, path, seconds, read))
+
+
+def timed(function, stage):
+    """ function wrapped in Timed while a run collects, function itself otherwise """
+    return Timed(function, stage) if _active is not None else function
+
+
+def unwrap(outcome):
+    """ Record the sample of a TimedResult and return its value, pass anything else through """
+    if isinstance(outcome, TimedResult):
+        stats().sample(outcome.sample)
+        return outcome.value
+    return outcome
+
+
+def timed_iter(iterable, stage):
+    """ Yield from iterable, adding the time spent waiting on it to stage """
+    if _active is None:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            _active.add_time(stage, time.perf_counter() - start)
+            return
+        _active.add_time(stage, time.perf_counter() - start)
+        yield item
+
+
+def _thread_bytes_read():
+    # rchar: bytes returned by read() and friends, page cache hits included.
+    # Reads through mmap don't show up here.
+    try:
+        with open(THREAD_IO, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    for line in data.splitlines():
+        if line.startswith(b"rchar:"):
+            return int(line.split()[1])
+    return None
+
+
+def _read_overhead():
+    # Reading the counter shows up in the counter, measure it once
+    global _overhead
+    if _overhead is None:
+        first = _thread_bytes_read()
+        second = _thread_bytes_read()
+        _overhead = second - first if first is not None and second is not None else 0
+    return _overhead
+
+
+def _top_functions(profile):
+    stream = io.StringIO()
+    stats = pstats.Stats(profile, stream=stream)
+    rows = []
+    for (filename, line, name), (calls, _, own, cumulative, _) in stats.stats.items():
+        rows.append({"function": "{}:{}({})".format(os.path.basename(filename), line, name),
+            "calls": calls, "own_seconds": round(own, 4), "cumulative_seconds": round(cumulative, 4)})
+    rows.sort(key=lambda row: row["cumulative_seconds"], reverse=True)
+    return rows[:TOP_FUNCTIONS]
+
+
+@contextmanager
+def profiling(tool, path, cprofile=False):
+    """
+    Collect for the duration of the block and write the report to path
+    at the end, even when the block fails. Does nothing when path is empty.
+    """
+    if not path:
+        yield None
+        return
+    collected = enable(tool, cprofile)
+    try:
+        yield collected
+    finally:
+        finish(path)
@@ -0,0 +1,332 @@
+# MIT License
+
+# Copyright (c) 2020 Lauri P. Laux Jr
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#
+# Crash safe move engine used to quarantine files.
+#
+# Destination names are reserved in memory from a single scandir of the
+# target folder, so thousands of files sharing a name don't turn into
+# thousands of stat calls each. Every planned move is written to a
+# journal in the target folder before anything is touched; an
+# interrupted run can be resumed from it and the last runs can be undone.
+#
+
+import errno
+import json
+import os
+import shutil
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+JOURNAL_NAME = ".move-journal.jsonl"
+MOVE_WORKERS = 8
+FLUSH_EVERY = 64
+KEEP_RUNS = 20 # finished runs kept in the journal for undo_all
+
+
+class MoveEngine:
+    """
+    Move files into a folder, journaling every move.
+
+    Every call to move() is a run. The journal holds one JSON object per
+    line: {"run": n} when a run starts, every planned move of the run
+    ({"src": ..., "dst": ...}), then {"done": i} as each one completes and
+    {"end": true} when the run finishes; i counts the moves of the run.
+    Undoing writes {"undone": i, "run": n}. When a run ends the journal is
+    compacted to the moves that can still be undone of the last KEEP_RUNS
+    runs. Moves on the same filesystem are a plain os.rename; moves across
+    devices are copied and unlinked on a thread pool.
+    """
+
+    def __init__(self, to_folder, workers=MOVE_WORKERS):
+        self.to_folder = to_folder
+        self.workers = workers
+        self.journal_path = os.path.join(to_folder, JOURNAL_NAME)
+        self.errors = []
+        self._devices = {}
+        self._journal = None
+        self._unflushed = 0
+
+    def pending(self):
+        """Number of moves left by an interrupted run."""
+        runs = self._load()
+        if not runs or runs[-1].ended:
+            return 0
+        return len(runs[-1].moves) - len(runs[-1].done)
+
+    def undoable(self, all_runs=False):
+        """Number of moves of the last run (or of every run kept) that can still be undone."""
+        runs = self._load()
+        return sum(len(run.done - run.undone) for run in (runs if all_runs else runs[-1:]))
+
+    def move(self, sources, progress=None):
+        """
+        Move every source file into the target folder.
+
+        Returns:
+            list: (source, destination) of each file moved
+
+        Raises:
+            RuntimeError: An interrupted run has to be resumed first
+        """
+        runs = self._load()
+        if runs and not runs[-1].ended:
+            raise RuntimeError("unfinished moves in {}, resume them first".format(self.journal_path))
+        taken = {os.path.normcase(entry.name) for entry in os.scandir(self.to_folder)}
+        counters = {}
+        run = _Run(runs[-1].number + 1 if runs else 1)
+        for source in sources:
+            name = _unique_name(os.path.basename(source), taken, counters)
+            run.moves.append((source, os.path.join(self.to_folder, name)))
+        runs.append(run)
+        self._open("a")
+        self._write({"run": run.number})
+        for source, destination in run.moves:
+            self._write({"src": source, "dst": destination})
+        self._sync()
+        return self._run(runs, range(len(run.moves)), progress)
+
+    def resume(self, progress=None):
+        """Finish the moves of an interrupted run, returns the moves done."""
+        runs = self._load()
+        if not runs or runs[-1].ended:
+            return []
+        run = runs[-1]
+        todo = []
+        for i, (source, destination) in enumerate(run.moves):
+            if i in run.done:
+                continue
+            if os.path.exists(destination):
+                if not os.path.exists(source):
+                    # Moved before the crash, only the journal line was lost
+                    run.done.add(i)
+                    if progress:
+                        progress()
+                    continue
+                # Cross device copy died halfway, start it over
+                try:
+                    os.remove(destination)
+                except OSError as error:
+                    self.errors.append((source, error))
+                    if progress:
+                        progress()
+                    continue
+            todo.append(i)
+        self._open("a")
+        for i in sorted(run.done):
+            self._write({"done": i})
+        return self._run(runs, todo, progress)
+
+    def undo(self, progress=None, all_runs=False):
+        """
+        Move the files of the last run, or of every run kept with
+        all_runs, back where they came from. Latest moves go first.
+        """
+        runs = self._load()
+        self._open("a")
+        restored = []
+        for run in reversed(runs if all_runs else runs[-1:]):
+            for i in sorted(run.done - run.undone, reverse=True):
+                destination, source = run.moves[i]
+                try:
+                    if os.path.exists(destination):
+                        raise FileExistsError(errno.EEXIST, "File already exists", destination)
+                    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+                    self._transfer(source, destination)
+                    restored.append((source, destination))
+                    run.undone.add(i)
+                    self._write({"undone": i, "run": run.number})
+                except OSError as error:
+                    self.errors.append((source, error))
+                if progress:
+                    progress()
+        self._close()
+        self._compact(runs)
+        return restored
+
+    def _run(self, runs, todo, progress):
+        run = runs[-1]
+        moved = []
+        destination_device = os.stat(self.to_folder).st_dev
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            copies = {}
+            for i in todo:
+                source, destination = run.moves[i]
+                try:
+                    if self._device(source) == destination_device:
+                        os.rename(source, destination)
+                    else:
+                        copies[pool.submit(_copy, source, destination)] = i
+                        continue
+                    moved.append(run.moves[i])
+                    run.done.add(i)
+                    self._write({"done": i})
+                except OSError as error:
+                    self.errors.append((source, error))
+                if progress:
+                    progress()
+            for future in as_completed(copies):
+                i = copies[future]
+                try:
+                    future.result()
+                    moved.append(run.moves[i])
+                    run.done.add(i)
+                    self._write({"done": i})
+                except OSError as error:
+                    self.errors.append((run.moves[i][0], error))
+                if progress:
+                    progress()
+        self._write({"end": True})
+        self._close()
+        run.ended = True
+        self._compact(runs)
+        return moved
+
+    def _compact(self, runs):
+        # Only the moves that can still be undone are kept, failed and
+        # undone ones are dropped along with the runs beyond KEEP_RUNS.
+        # An unfinished run is kept whole for resume().
+        kept = []
+        for run in runs:
+            if not run.ended:
+                kept.append(run)
+                continue
+            left = _Run(run.number, ended=True)
+            left.moves = [run.moves[i] for i in sorted(run.done - run.undone)]
+            left.done = set(range(len(left.moves)))
+            if left.moves:
+                kept.append(left)
+        finished = [run for run in kept if run.ended]
+        kept = [run for run in kept if not run.ended or run in finished[-KEEP_RUNS:]]
+        if not kept:
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            return
+        temporary = self.journal_path + ".tmp"
+        self._journal = open(temporary, "w", encoding="utf-8")
+        for run in kept:
+            self._write({"run": run.number})
+            for source, destination in run.moves:
+                self._write({"src": source, "dst": destination})
+            for i in sorted(run.done):
+                self._write({"done": i})
+            for i in sorted(run.undone):
+                self._write({"undone": i, "run": run.number})
+            if run.ended:
+                self._write({"end": True})
+        self._close()
+        os.replace(temporary, self.journal_path)
+
+    def _transfer(self, source, destination):
+        if self._device(source) == os.stat(os.path.dirname(destination) or ".").st_dev:
+            os.rename(source, destination)
+        else:
+            _copy(source, destination)
+
+    def _device(self, path):
+        folder = os.path.dirname(path)
+        if folder not in self._devices:
+            self._devices[folder] = os.stat(folder or ".").st_dev
+        return self._devices[folder]
+
+    def _load(self):
+        runs = []
+        if not os.path.isfile(self.journal_path):
+            return runs
+        with open(self.journal_path, "r", encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn last line of a crashed run
+                    continue
+                if "undone" in record:
+                    numbered = [run for run in runs if run.number == record.get("run")]
+                    if numbered or runs:
+                        (numbered or runs)[-1].undone.add(record["undone"])
+                elif "run" in record:
+                    runs.append(_Run(record["run"]))
+                elif "src" in record:
+                    if not runs:
+                        # Journal of an older version, one run without a marker
+                        runs.append(_Run(0))
+                    runs[-1].moves.append((record["src"], record["dst"]))
+                    runs[-1].ended = False
+                elif "done" in record and runs:
+                    runs[-1].done.add(record["done"])
+                elif "end" in record and runs:
+                    runs[-1].ended = True
+        return runs
+
+    def _open(self, mode):
+        self._journal = open(self.journal_path, mode, encoding="utf-8")
+        self._unflushed = 0
+
+    def _write(self, record):
+        self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._unflushed += 1
+        if self._unflushed >= FLUSH_EVERY:
+            self._journal.flush()
+            self._unflushed = 0
+
+    def _sync(self):
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._unflushed = 0
+
+    def _close(self):
+        self._sync()
+        self._journal.close()
+        self._journal = None
+
+
+class _Run:
+
+    def __init__(self, number, ended=False):
+        self.number = number
+        self.moves = []
+        self.done = set()
+        self.undone = set()
+        self.ended = ended
+
+
+def _unique_name(name, taken, counters):
+    key = os.path.normcase(name)
+    if key not in taken:
+        taken.add(key)
+        return name
+    base, ext = os.path.splitext(name)
+    # Continue from the last suffix handed out for this name
+    suffix = counters.get(key, 0)
+    while True:
+        suffix += 1
+        candidate = "{}-({}){}".format(base, suffix, ext)
+        if os.path.normcase(candidate) not in taken:
+            break
+    counters[key] = suffix
+    taken.add(os.path.normcase(candidate))
+    return candidate
+
+
+def _copy(source, destination):
+    shutil.copy2(source, destination)
+    os.unlink(source)
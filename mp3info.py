@@ -0,0 +1,191 @@
+# MIT License
+
+# Copyright (c) 2020 Lauri P. Laux Jr
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#
+# MPEG audio frame header reader.
+#
+# Bitrate, sample rate and duration come from the first frame header
+# after the ID3v2 tag plus the Xing/Info or VBRI header the encoder puts
+# in that frame for VBR files. A single small read per file, no decoding
+# and no walk over the frames.
+#
+
+import struct
+
+from collections import namedtuple
+from id3tags import audio_bounds
+
+FRAME_READ = 4096 # bytes read from the start of the audio
+SYNC_SEARCH = 2048 # garbage tolerated before the first frame
+
+MPEG1 = 3
+MPEG2 = 2
+MPEG25 = 0
+VERSIONS = {MPEG1: "1", MPEG2: "2", MPEG25: "2.5"}
+LAYERS = {3: 1, 2: 2, 1: 3}
+MONO = 3
+
+# kbps by bitrate index, 0 is free format and 15 is invalid
+BITRATES = {
+    (MPEG1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (MPEG1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (MPEG1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (MPEG2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (MPEG2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+BITRATES[(MPEG2, 3)] = BITRATES[(MPEG2, 2)]
+for layer in (1, 2, 3):
+    BITRATES[(MPEG25, layer)] = BITRATES[(MPEG2, layer)]
+SAMPLE_RATES = {MPEG1: [44100, 48000, 32000], MPEG2: [22050, 24000, 16000], MPEG25: [11025, 12000, 8000]}
+
+XING_FRAMES = 0x1
+XING_BYTES = 0x2
+
+AudioInfo = namedtuple("AudioInfo", ["version", "layer", "bitrate", "sample_rate", "channels", "duration", "vbr"])
+FrameHeader = namedtuple("FrameHeader", ["version", "layer", "bitrate", "sample_rate", "channels", "samples", "length"])
+
+
+def read_audio_info(path, bounds=None, size=None):
+    """
+    Read bitrate, sample rate and duration of an MP3 file.
+
+    Args:
+        path (str): MP3 file
+        bounds (tuple): (start, end) of the audio frames as returned by
+            id3tags.audio_bounds, read from the file when None
+        size (int): File size, only needed when bounds is None
+
+    Returns:
+        AudioInfo: bitrate in kbps (average for VBR), duration in seconds,
+            or None when no valid frame header is found
+    """
+    with open(path, "rb") as f:
+        if bounds is None:
+            if size is None:
+                f.seek(0, 2)
+                size = f.tell()
+            bounds = audio_bounds(path, size)
+        start, end = bounds
+        f.seek(start)
+        data = f.read(FRAME_READ)
+    return parse_audio_info(data, end - start)
+
+
+def parse_audio_info(data, audio_size):
+    """
+    AudioInfo from the first bytes of the audio frames.
+
+    Args:
+        data (bytes): Bytes from the start of the audio
+        audio_size (int): Size of all the audio frames, tags excluded
+    """
+    offset, header = _first_frame(data)
+    if header is None:
+        return None
+    audio_size -= offset
+    frame = data[offset:offset + header.length]
+
+    frames = audio_bytes = None
+    vbr = False
+    xing = _xing_offset(header)
+    tag = frame[xing:xing + 4]
+    if tag in (b"Xing", b"Info"):
+        vbr = tag == b"Xing"
+        flags = struct.unpack_from(">I", frame, xing + 4)[0] if len(frame) >= xing + 8 else 0
+        pos = xing + 8
+        if flags & XING_FRAMES and len(frame) >= pos + 4:
+            frames = struct.unpack_from(">I", frame, pos)[0]
+            pos += 4
+        if flags & XING_BYTES and len(frame) >= pos + 4:
+            audio_bytes = struct.unpack_from(">I", frame, pos)[0]
+    elif frame[36:40] == b"VBRI" and len(frame) >= 54:
+        vbr = True
+        audio_bytes, frames = struct.unpack_from(">II", frame, 46)
+
+    if frames:
+        duration = frames * header.samples / header.sample_rate
+        if not audio_bytes:
+            # The Xing/VBRI frame itself holds no audio
+            audio_bytes = audio_size - header.length
+        bitrate = audio_bytes * 8 / duration / 1000 if duration else header.bitrate
+    elif header.bitrate:
+        # Constant bitrate without a header: the size says it all
+        bitrate = header.bitrate
+        duration = audio_size * 8 / (bitrate * 1000)
+    else:
+        return None
+    return AudioInfo(VERSIONS[header.version], header.layer, round(bitrate), header.sample_rate,
+        1 if header.channels == MONO else 2, duration, vbr)
+
+
+def parse_frame_header(data, offset=0):
+    """ Return the FrameHeader at data[offset:], None if it isn't a valid one """
+    if len(data) < offset + 4:
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    if data[offset] != 0xFF or b1 & 0xE0 != 0xE0:
+        return None
+    version = (b1 >> 3) & 3
+    layer = LAYERS.get((b1 >> 1) & 3)
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 3
+    if version == 1 or layer is None or bitrate_index == 15 or rate_index == 3:
+        return None
+    bitrate = BITRATES[(version, layer)][bitrate_index]
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+    else:
+        samples = 576 if layer == 3 and version != MPEG1 else 1152
+        length = samples // 8 * bitrate * 1000 // sample_rate + padding
+    return FrameHeader(version, layer, bitrate, sample_rate, b3 >> 6, samples, length)
+
+
+def _first_frame(data):
+    """
+    Find the first frame header, confirmed by the header of the frame that
+    follows it when that one is inside data: a lone 0xFFE sync pattern in
+    leftover tag bytes is common.
+    """
+    offset = data.find(b"\xff")
+    limit = min(len(data) - 4, SYNC_SEARCH)
+    while 0 <= offset <= limit:
+        header = parse_frame_header(data, offset)
+        if header is not None and header.length:
+            following = offset + header.length
+            if following + 4 > len(data) or _same_stream(header, parse_frame_header(data, following)):
+                return offset, header
+        offset = data.find(b"\xff", offset + 1)
+    return 0, None
+
+
+def _same_stream(header, other):
+    return other is not None and (other.version, other.layer, other.sample_rate) == (header.version, header.layer, header.sample_rate)
+
+
+def _xing_offset(header):
+    # The Xing/Info tag follows the side information of the first frame
+    if header.version == MPEG1:
+        return 4 + (17 if header.channels == MONO else 32)
+    return 4 + (9 if header.channels == MONO else 17)
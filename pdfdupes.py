@@ -0,0 +1,172 @@
+# MIT License
+
+# Copyright (c) 2020 Lauri P. Laux Jr
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#
+# Duplicate and near duplicate detection for PDF catalogues.
+#
+# Exact copies are found by grouping on (size, pages), which the
+# catalogue already has, and hashing the raw bytes of the files that
+# share a group. Different editions or re-exports of the same document
+# don't share bytes, so their first page text is reduced to a MinHash
+# signature and locality sensitive hashing (LSH) buckets the signatures:
+# only documents landing in the same bucket are compared, never every
+# pair of documents.
+#
+
+import hashlib
+import zlib
+
+import numpy as np
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+NUM_PERMUTATIONS = 64
+BANDS = 16 # 16 bands of 4 rows, pairs above ~0.5 similarity become candidates
+SHINGLE_WORDS = 3
+MIN_SHINGLES = 5 # shorter texts are too generic to compare
+MERSENNE_PRIME = (1 << 61) - 1
+HASH_WORKERS = 8
+
+Cluster = namedtuple("Cluster", ["files", "similarity"])
+
+
+def exact_duplicates(records, workers=HASH_WORKERS):
+    """
+    Group records of byte identical files.
+
+    Args:
+        records (list): Catalogue records (fullpath, size and pages used)
+
+    Returns:
+        list: Clusters (files, similarity=1.0) of 2+ paths
+    """
+    groups = {}
+    for record in records:
+        groups.setdefault((record.get("size"), record.get("pages")), []).append(record["fullpath"])
+    candidates = [path for paths in groups.values() if len(paths) > 1 for path in paths]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        digests = dict(zip(candidates, pool.map(_file_digest, candidates)))
+    clusters = {}
+    for path in candidates:
+        if digests[path] is not None:
+            clusters.setdefault(digests[path], []).append(path)
+    return [Cluster(sorted(paths), 1.0) for paths in clusters.values() if len(paths) > 1]
+
+
+def near_duplicates(texts, threshold=0.8, num_permutations=NUM_PERMUTATIONS, bands=BANDS, seed=1):
+    """
+    Group documents whose first page texts are similar.
+
+    Args:
+        texts (iterable): (path, first page text) pairs, consumed once so
+            it can stream from the catalogue
+        threshold (float): Minimum estimated Jaccard similarity of the
+            word shingles for two documents to be grouped
+
+    Returns:
+        list: Clusters (files, lowest similarity that joined the cluster)
+    """
+    rows = num_permutations // bands
+    hasher = MinHasher(num_permutations, seed)
+    paths = []
+    signatures = []
+    for path, text in texts:
+        signature = hasher.signature(text)
+        if signature is not None:
+            paths.append(path)
+            signatures.append(signature)
+    if not signatures:
+        return []
+    signatures = np.vstack(signatures)
+
+    parent = list(range(len(paths)))
+    lowest = {}
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(bands):
+        buckets = {}
+        chunk = signatures[:, band * rows:(band + 1) * rows]
+        for i in range(len(paths)):
+            buckets.setdefault(chunk[i].tobytes(), []).append(i)
+        for members in buckets.values():
+            # Each member is compared against one document of every cluster
+            # met in the bucket so far, an unrelated first member doesn't
+            # keep two near duplicates behind it apart
+            leaders = []
+            for other in members:
+                for leader in leaders:
+                    root, joined = find(leader), find(other)
+                    if root == joined:
+                        break
+                    similarity = float(np.mean(signatures[leader] == signatures[other]))
+                    if similarity >= threshold:
+                        parent[joined] = root
+                        lowest[root] = min(similarity, lowest.get(root, 1.0), lowest.pop(joined, 1.0))
+                        break
+                else:
+                    leaders.append(other)
+
+    clusters = {}
+    for i, path in enumerate(paths):
+        clusters.setdefault(find(i), []).append(path)
+    return [Cluster(sorted(members), round(lowest.get(root, 1.0), 3))
+        for root, members in clusters.items() if len(members) > 1]
+
+
+class MinHasher:
+    """MinHash signatures of word shingles with universal hashing."""
+
+    def __init__(self, num_permutations=NUM_PERMUTATIONS, seed=1):
+        rng = np.random.default_rng(seed)
+        # a * x + b stays below 2**64 for 32 bit shingle hashes
+        self.a = rng.integers(1, 1 << 31, size=num_permutations, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 31, size=num_permutations, dtype=np.uint64)
+
+    def signature(self, text):
+        shingles = self.shingles(text)
+        if len(shingles) < MIN_SHINGLES:
+            return None
+        values = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+        hashed = (self.a[:, None] * values[None, :] + self.b[:, None]) % np.uint64(MERSENNE_PRIME)
+        return hashed.min(axis=1)
+
+    def shingles(self, text):
+        words = (text or "").lower().split()
+        return {zlib.crc32(" ".join(words[i:i + SHINGLE_WORDS]).encode("utf-8"))
+            for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def _file_digest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
@@ -0,0 +1,176 @@
+# MIT License
+
+# Copyright (c) 2020 Lauri P. Laux Jr
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#
+# Persistent full text index over the pdforganized catalogue.
+#
+# Title, author, subject and first page text of every PDF go into a
+# SQLite FTS5 table, so searching tens of thousands of documents is a
+# single indexed query instead of loading the whole JSON catalogue.
+# The index is synced from the catalogue records by path, mtime, size
+# and whether they have first page text: only new or changed documents
+# are written again.
+#
+
+import os
+import sqlite3
+
+from collections import namedtuple
+
+SearchHit = namedtuple("SearchHit", ["path", "title", "author", "pages", "snippet"])
+SyncStats = namedtuple("SyncStats", ["added", "updated", "removed", "unchanged"])
+
+# bm25 weights of the title, author, subject and text columns
+RANK_WEIGHTS = (10.0, 5.0, 3.0, 1.0)
+
+
+class PdfIndex:
+    """
+    SQLite FTS5 index of PDF catalogue records.
+
+    pdf_files keeps one row per path with the mtime and size it was
+    indexed at and whether it had text, pdf_text is the FTS5 table
+    sharing its rowid.
+    """
+
+    def __init__(self, path, rebuild=False):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        if rebuild:
+            self._db.execute("DROP TABLE IF EXISTS pdf_files")
+            self._db.execute("DROP TABLE IF EXISTS pdf_text")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pdf_files ("
+            " id INTEGER PRIMARY KEY,"
+            " path TEXT NOT NULL UNIQUE,"
+            " mtime INTEGER,"
+            " size INTEGER,"
+            " pages INTEGER,"
+            " has_text INTEGER)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(pdf_files)")}
+        if "has_text" not in columns:
+            # Index of an older version, its rows get synced again once
+            self._db.execute("ALTER TABLE pdf_files ADD COLUMN has_text INTEGER")
+        try:
+            self._db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS pdf_text USING fts5("
+                " title, author, subject, text,"
+                " tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        except sqlite3.OperationalError as error:
+            raise RuntimeError("SQLite was built without FTS5: {}".format(error))
+        self._db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def sync(self, records):
+        """
+        Bring the index in line with a full set of catalogue records.
+        Paths missing from records are dropped from the index.
+
+        Returns:
+            SyncStats: how many documents were added, updated, removed or
+                left untouched
+        """
+        known = {path: (row_id, (mtime, size, has_text)) for row_id, path, mtime, size, has_text in
+            self._db.execute("SELECT id, path, mtime, size, has_text FROM pdf_files")}
+        seen = set()
+        added = updated = unchanged = 0
+        with self._db:
+            for record in records:
+                path = record["fullpath"]
+                seen.add(path)
+                # Text added by a later scan --text counts as a change
+                state = (record.get("mtime"), record.get("size"), _has_text(record))
+                if path in known:
+                    row_id, known_state = known[path]
+                    if known_state == state:
+                        unchanged += 1
+                        continue
+                    self._delete(row_id)
+                    updated += 1
+                else:
+                    added += 1
+                self._insert(record)
+            removed = 0
+            for path, (row_id, _) in known.items():
+                if path not in seen:
+                    self._delete(row_id)
+                    removed += 1
+        return SyncStats(added, updated, removed, unchanged)
+
+    def search(self, query, limit=20, raw=False):
+        """
+        Search the index, best matches first.
+
+        Args:
+            query (str): Words that must all appear, or an FTS5 query when raw
+            limit (int): Maximum number of hits
+            raw (bool): Pass query to FTS5 untouched (AND/OR/NEAR, prefix*...)
+
+        Raises:
+            ValueError: A raw query FTS5 can't parse
+        """
+        if not raw:
+            query = " ".join('"{}"'.format(word.replace('"', '""')) for word in query.split())
+        try:
+            rows = self._db.execute(
+                "SELECT f.path, t.title, t.author, f.pages, snippet(pdf_text, -1, '[', ']', '...', 12)"
+                " FROM pdf_text t JOIN pdf_files f ON f.id = t.rowid"
+                " WHERE pdf_text MATCH ? ORDER BY bm25(pdf_text, ?, ?, ?, ?) LIMIT ?",
+                (query,) + RANK_WEIGHTS + (limit,),
+            ).fetchall()
+        except sqlite3.OperationalError as error:
+            raise ValueError("invalid search query {!r}: {}".format(query, error))
+        return [SearchHit(*row) for row in rows]
+
+    def close(self):
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+    def _insert(self, record):
+        info = record.get("info") or {}
+        cursor = self._db.execute(
+            "INSERT INTO pdf_files (path, mtime, size, pages, has_text) VALUES (?, ?, ?, ?, ?)",
+            (record["fullpath"], record.get("mtime"), record.get("size"), record.get("pages"), _has_text(record)),
+        )
+        # Files without metadata are still found by their file name
+        title = info.get("title") or os.path.splitext(record.get("filename") or os.path.basename(record["fullpath"]))[0]
+        self._db.execute(
+            "INSERT INTO pdf_text (rowid, title, author, subject, text) VALUES (?, ?, ?, ?, ?)",
+            (cursor.lastrowid, title, info.get("author"), info.get("subject"), info.get("text")),
+        )
+
+    def _delete(self, row_id):
+        self._db.execute("DELETE FROM pdf_text WHERE rowid = ?", (row_id,))
+        self._db.execute("DELETE FROM pdf_files WHERE id = ?", (row_id,))
+
+
+def _has_text(record):
+    return int(bool((record.get("info") or {}).get("text")))
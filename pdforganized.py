@@ -35,53 +35,78 @@
 import os
 import json
 import re
-from PyPDF2 import PdfFileReader
-from PyPDF2.utils import PdfReadError
-from PyPDF2.pdf import PageObject
+import argparse
+import instrument
+import time
+from functools import partial
+from PyPDF2 import PdfReader
+from PyPDF2.errors import DependencyError, FileNotDecryptedError, PyPdfError
 from pathlib import Path
+from folderscan import scan_files
+from pdfdupes import exact_duplicates, near_duplicates
+from pdfindex import PdfIndex
+from pdftrailer import PdfTrailerError, read_pdf_info
 from progress.bar import Bar
 from progress.spinner import Spinner
+from taskpool import TaskPool
 
 PDF_MIN_SIZE = 512 # 512Kb
+PDF_TIMEOUT = 60 # seconds per file
+PDF_MAX_MEMORY = 2048 # Mb per worker process
+PDF_OUTPUT = "data.jsonl"
+FLUSH_EVERY = 50 # records
+FLUSH_SECONDS = 5
+PDF_INDEX = "data-index.sqlite"
+PDF_DUPLICATES = "duplicates.json"
 
-def getFilesFromFolder(folder, types=[".pdf"]):
-    fileList = []
-    if os.path.isdir(folder):
-        for root, _, files in os.walk(folder):
-            if len(files) == 0:
-                break
-            for file in files:
-                path = os.path.join(root, file)
-                size = os.path.getsize(path)
-                extension = os.path.splitext(file)[-1]
-                if extension == ".pdf":
-                    info, pages = extract_information(path)
-                    fileList.append({"filename": file, "fullpath": path, "size": size, "pages": pages, "info": info})
-    return fileList
-
-
-def findAllFolders(folder):
-    folders = []
-    folders.append(folder)
+def getFilesFromFolder(folder, types=[".pdf"], jobs=None, timeout=PDF_TIMEOUT, maxMemory=PDF_MAX_MEMORY, withText=False):
+    return list(iterFilesFromFolder(folder, types, jobs, timeout, maxMemory, withText=withText))
+
+def iterFilesFromFolder(folder, types=[".pdf"], jobs=None, timeout=PDF_TIMEOUT, maxMemory=PDF_MAX_MEMORY, skip=(), withText=False):
+    """ Yield one record per PDF as soon as it is processed, ignoring paths in skip """
     if os.path.isdir(folder):
-        for root, dirs, _ in os.walk(folder):
-            for folder in dirs:
-                fullpath = os.path.join(root, folder)
-                folders.append(fullpath)
-                #print('-> added %s folder.' % fullpath)
-    return folders
-
-def extract_information(pdf_path):
+        spinner = Spinner("-> Scanning folders ")
+        entries = {}
+        for entry in instrument.timed_iter(scan_files(folder, types), "scan"):
+            if entry.path not in skip:
+                entries[entry.path] = entry
+            spinner.next()
+        spinner.finish()
+        pool = TaskPool(instrument.timed(partial(extract_information, withText=withText), "parse"), jobs, timeout, maxMemory * 1024 * 1024 if maxMemory else None)
+        with Bar('-> Analysing files ', max=len(entries)) as bar:
+            for result in pool.run(entries):
+                bar.next()
+                entry = entries[result.item]
+                if result.failure:
+                    info, pages = {"error": result.failure, "message": result.message}, 0
+                    instrument.stats().count(result.failure)
+                else:
+                    info, pages = instrument.unwrap(result.value)
+                    if "error" in info:
+                        instrument.stats().count(info["error"])
+                yield {"filename": entry.name, "fullpath": entry.path, "size": entry.size, "mtime": entry.mtime, "pages": pages, "info": info}
+
+def extract_information(pdf_path, withText=False):
+    if not withText:
+        try:
+            information, number_of_pages = read_pdf_info(pdf_path)
+            if information is None:
+                return {"error": "no info"}, number_of_pages
+            information["text"] = None
+            return information, number_of_pages
+        except (PdfTrailerError, OSError):
+            # Unusual file, PyPDF2 will read (or classify) it
+            pass
     information = None
     number_of_pages = 0
     try:
         with open(pdf_path, 'rb') as f:
-            pdf = PdfFileReader(f, strict=False)
-            if pdf.isEncrypted:
-                pdf.decrypt('')
-            docinfo = pdf.getDocumentInfo()
-            number_of_pages = pdf.getNumPages()
-            text = get_firstpage_text(pdf)
+            pdf = PdfReader(f, strict=False)
+            if pdf.is_encrypted and not pdf.decrypt(''):
+                return {"error": "encrypted", "message": "password protected"}, number_of_pages
+            docinfo = pdf.metadata
+            number_of_pages = len(pdf.pages)
+            text = get_firstpage_text(pdf) if withText else None
             if docinfo:
                 information = {"author": docinfo.author, 
                     "creator": docinfo.creator,
@@ -91,33 +116,214 @@ def extract_information(pdf_path):
                     "text": text}
             else:
                 information = {"error": "no info"}
+    except (FileNotDecryptedError, DependencyError) as error:
+        information = {"error": "encrypted", "message": str(error)}
+    except PyPdfError as error:
+        information = {"error": "corrupt", "message": str(error)}
+    except OSError as error:
+        information = {"error": "io", "message": str(error)}
     except Exception as error:
-        information = {"error": error.args[0]}
+        information = {"error": "unknown", "message": "{}: {}".format(type(error).__name__, error)}
     return information, number_of_pages
 
 def get_firstpage_text(pdf):
-    page = pdf.getPage(pageNumber=0)
-    text = page.extractText()
+    page = pdf.pages[0]
+    text = page.extract_text()
     #text = re.sub(r'\W+', '', text)
     text = ''.join(c for c in text if c.isalnum() or c == ' ')
     return text
 
-def find_pdf_books(folder):
-    fileList = []
+def find_pdf_books(folder, output=PDF_OUTPUT, resume=False, jsonOutput=None, jobs=None, timeout=PDF_TIMEOUT, maxMemory=PDF_MAX_MEMORY, withText=False, indexPath=PDF_INDEX):
     print("PDF organizer\n")
-    folders = findAllFolders(folder)
-    with Bar('-> Analysing files ', max=len(folders)) as bar:
-        for folder in folders:
-            bar.next()
-            folderFileList = getFilesFromFolder(folder)
-            if len(folderFileList) > 0:
-                fileList = fileList + folderFileList
-    with open('data.json', 'w') as f:
-        json.dump(fileList, f, ensure_ascii=False, indent=4)
-        print("JSON saved.")
-    print('\nFound %d files.' % len(fileList))
+    if not os.path.isdir(folder):
+        print("Folder '{}' does not exist, '{}' left untouched.".format(folder, output))
+        return
+    done = loadRecordPaths(output) if resume else set()
+    if done:
+        print("Resuming, {} files already in '{}'.".format(len(done), output))
+    found = 0
+    with open(output, 'a' if resume else 'w', encoding='utf-8') as f:
+        lastFlush = time.monotonic()
+        for record in iterFilesFromFolder(folder, jobs=jobs, timeout=timeout, maxMemory=maxMemory, skip=done, withText=withText):
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            found += 1
+            if found % FLUSH_EVERY == 0 or time.monotonic() - lastFlush > FLUSH_SECONDS:
+                f.flush()
+                lastFlush = time.monotonic()
+    print("JSON Lines saved: '{}'.".format(output))
+    if jsonOutput:
+        with instrument.stats().stage("export"):
+            total = jsonLinesToJson(output, jsonOutput)
+        print("JSON saved: '{}' ({} files).".format(jsonOutput, total))
+    if indexPath:
+        with instrument.stats().stage("index"):
+            update_index(output, indexPath)
+    instrument.stats().count("files", found)
+    if done:
+        print('\nFound %d new files, %d in the catalogue.' % (found, found + len(done)))
+    else:
+        print('\nFound %d files.' % found)
+
+def update_index(output=PDF_OUTPUT, indexPath=PDF_INDEX, rebuild=False):
+    with PdfIndex(indexPath, rebuild=rebuild) as index:
+        stats = index.sync(readRecords(output))
+    print("Index '{}': {} added, {} updated, {} removed, {} unchanged.".format(
+        indexPath, stats.added, stats.updated, stats.removed, stats.unchanged))
+
+def search_pdf_books(query, indexPath=PDF_INDEX, limit=20, raw=False):
+    if not os.path.isfile(indexPath):
+        print("Index '{}' not found, run a scan first.".format(indexPath))
+        return []
+    with PdfIndex(indexPath) as index:
+        try:
+            hits = index.search(query, limit=limit, raw=raw)
+        except ValueError as error:
+            print("Query syntax error: {}".format(error))
+            return []
+    for hit in hits:
+        print("{} ({} pages)".format(hit.path, hit.pages))
+        print("    {} - {}".format(hit.title, hit.author or "unknown author"))
+        print("    {}".format(hit.snippet))
+    print("\n{} results.".format(len(hits)))
+    return hits
+
+def find_duplicate_books(output=PDF_OUTPUT, report=PDF_DUPLICATES, threshold=0.8):
+    print("PDF duplicate finder\n")
+    records = [{"fullpath": r["fullpath"], "size": r.get("size"), "pages": r.get("pages")} for r in readRecords(output)]
+    exact = exact_duplicates(records)
+    print("Exact copies: {} groups, {} files.".format(len(exact), sum(len(c.files) for c in exact)))
+    # Only one file of each exact group takes part in the text comparison
+    copies = {path for cluster in exact for path in cluster.files[1:]}
+    withoutText = [0]
+
+    def texts():
+        for record in readRecords(output):
+            text = (record.get("info") or {}).get("text")
+            if not text:
+                withoutText[0] += 1
+            elif record["fullpath"] not in copies:
+                yield record["fullpath"], text
+
+    similar = near_duplicates(texts(), threshold)
+    if records and withoutText[0] == len(records):
+        print("Similar first pages: skipped, no file has first page text (scan with --text to compare them).")
+    else:
+        print("Similar first pages: {} groups, {} files.".format(len(similar), sum(len(c.files) for c in similar)))
+        if withoutText[0]:
+            print("{} files have no first page text (scan with --text to compare them).".format(withoutText[0]))
+    with open(report, 'w', encoding='utf-8') as f:
+        json.dump({"exact": [c._asdict() for c in exact], "similar": [c._asdict() for c in similar]},
+            f, ensure_ascii=False, indent=4)
+    print("Report saved: '{}'.".format(report))
+    return exact, similar
+
+def readRecords(path):
+    with open(path, 'r', encoding='utf-8') as lines:
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+
+def loadRecordPaths(path):
+    """ Paths already in a JSON Lines output. A torn last line is cut off so new records can be appended """
+    paths = set()
+    if not os.path.isfile(path):
+        return paths
+    good = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b"\n"):
+                break
+            paths.add(record["fullpath"])
+            good += len(line)
+    with open(path, 'r+b') as f:
+        f.truncate(good)
+    return paths
+
+def jsonLinesToJson(source, destination):
+    """ Convert JSON Lines records to the pretty printed JSON array used by data.json """
+    total = 0
+    with open(source, 'r', encoding='utf-8') as lines, open(destination, 'w', encoding='utf-8') as f:
+        f.write("[")
+        for line in lines:
+            if not line.strip():
+                continue
+            record = json.dumps(json.loads(line), ensure_ascii=False, indent=4)
+            f.write(",\n" if total else "\n")
+            f.write("\n".join("    " + row for row in record.split("\n")))
+            total += 1
+        f.write("\n]" if total else "]")
+    return total
 
 
 if __name__=="__main__":
-    #find_pdf_books("/mnt/win10ssd/Users/lauri/Google Drive/Pessoal/RPG/")
-    find_pdf_books("/mnt/win10ssd/Users/lauri/Google Drive/Pessoal/")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="PDF organizer")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scan = commands.add_parser("scan", help="catalogue the PDF files of a folder.")
+    scan.add_argument("folder", metavar="folder", type=str,
+        help="folder to search for PDF files.")
+    scan.add_argument("--jobs", type=int, default=None,
+        help="number of worker processes (default: one per CPU).")
+    scan.add_argument("--timeout", type=float, default=PDF_TIMEOUT,
+        help="seconds a single PDF may take before it is given up (default: {}).".format(PDF_TIMEOUT))
+    scan.add_argument("--max-memory", type=int, default=PDF_MAX_MEMORY,
+        help="memory limit of each worker in Mb, 0 for none (default: {}).".format(PDF_MAX_MEMORY))
+    scan.add_argument("--output", default=PDF_OUTPUT,
+        help="JSON Lines file, one record per PDF (default: {}).".format(PDF_OUTPUT))
+    scan.add_argument("--resume", action="store_true",
+        help="skip PDFs already in the output and append the others.")
+    scan.add_argument("--json", default=None, metavar="PATH",
+        help="also convert the output to a pretty printed JSON array (like the old data.json).")
+    scan.add_argument("--text", action="store_true",
+        help="also extract the first page text (slow, needs a full PDF parse).")
+    scan.add_argument("--index", default=PDF_INDEX,
+        help="full text index updated after the scan, empty to skip (default: {}).".format(PDF_INDEX))
+    scan.add_argument("--profile", default=None, metavar="PATH",
+        help="write a JSON report of stage timings and per file latency.")
+    scan.add_argument("--cprofile", action="store_true",
+        help="include cProfile data of this process in the --profile report.")
+
+    index = commands.add_parser("index", help="update the full text index from a catalogue.")
+    index.add_argument("--output", default=PDF_OUTPUT,
+        help="JSON Lines catalogue (default: {}).".format(PDF_OUTPUT))
+    index.add_argument("--index", default=PDF_INDEX,
+        help="full text index file (default: {}).".format(PDF_INDEX))
+    index.add_argument("--rebuild", action="store_true",
+        help="drop the index and build it again.")
+
+    search = commands.add_parser("search", help="search the full text index.")
+    search.add_argument("query", nargs="+",
+        help="words to look for in title, author, subject and first page text.")
+    search.add_argument("--index", default=PDF_INDEX,
+        help="full text index file (default: {}).".format(PDF_INDEX))
+    search.add_argument("--limit", type=int, default=20,
+        help="maximum number of results (default: 20).")
+    search.add_argument("--raw", action="store_true",
+        help="use the query as FTS5 syntax (OR, NEAR, prefix*...).")
+
+    dedupe = commands.add_parser("dedupe", help="report duplicate and near duplicate PDFs of a catalogue.")
+    dedupe.add_argument("--output", default=PDF_OUTPUT,
+        help="JSON Lines catalogue (default: {}).".format(PDF_OUTPUT))
+    dedupe.add_argument("--report", default=PDF_DUPLICATES,
+        help="JSON report with the duplicate clusters (default: {}).".format(PDF_DUPLICATES))
+    dedupe.add_argument("--threshold", type=float, default=0.8,
+        help="minimum first page text similarity of near duplicates, 0-1 (default: 0.8).")
+
+    args = parser.parse_args()
+    if args.command == "scan":
+        with instrument.profiling("find_pdf_books", args.profile, args.cprofile):
+            find_pdf_books(args.folder, output=args.output, resume=args.resume, jsonOutput=args.json,
+                jobs=args.jobs, timeout=args.timeout, maxMemory=args.max_memory, withText=args.text,
+                indexPath=args.index)
+        if args.profile:
+            print("Profile report saved: '{}'.".format(args.profile))
+    elif args.command == "index":
+        update_index(args.output, args.index, rebuild=args.rebuild)
+    elif args.command == "dedupe":
+        find_duplicate_books(args.output, args.report, args.threshold)
+    else:
+        search_pdf_books(" ".join(args.query), args.index, limit=args.limit, raw=args.raw)
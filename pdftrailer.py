@@ -0,0 +1,459 @@
+# MIT License
+
+# Copyright (c) 2020 Lauri P. Laux Jr
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#
+# Lazy, trailer only reader for PDF document info and page count.
+#
+# Loading a PDF with PyPDF2 parses the whole cross reference table and
+# much of the object tree. For the Info dictionary and the page count
+# only a handful of objects are needed: the file is memory mapped, the
+# xref is located through "startxref" at the end of the file and only
+# the trailer, /Info, /Root and the /Pages root are resolved. Classic
+# xref tables, xref streams, object streams and incremental updates are
+# handled; anything else raises PdfTrailerError so the caller can fall
+# back to PyPDF2.
+#
+
+import mmap
+import re
+import zlib
+
+from collections import namedtuple
+
+TAIL_SIZE = 2048
+INFO_KEYS = {"/Author": "author", "/Creator": "creator", "/Producer": "producer", "/Subject": "subject", "/Title": "title"}
+
+RE_WHITESPACE = re.compile(rb"(?:[\x00\t\n\f\r ]+|%[^\r\n]*)*")
+RE_NUMBER = re.compile(rb"[+-]?(?:\d+\.?\d*|\.\d+)")
+RE_REFERENCE = re.compile(rb"(\d+)[\x00\t\n\f\r ]+(\d+)[\x00\t\n\f\r ]+R(?![A-Za-z])")
+RE_NAME = re.compile(rb"/[^\x00\t\n\f\r ()<>\[\]{}/%]*")
+RE_KEYWORD = re.compile(rb"[A-Za-z]+")
+RE_OBJECT = re.compile(rb"[\x00\t\n\f\r ]*(\d+)[\x00\t\n\f\r ]+(\d+)[\x00\t\n\f\r ]+obj")
+RE_SUBSECTION = re.compile(rb"[\x00\t\n\f\r ]*(\d+)[\x00\t\n\f\r ]+(\d+)[\x00\t\n\f\r ]*")
+RE_XREF_ENTRY = re.compile(rb"(\d{10}) (\d{5}) ([nf])")
+RE_STARTXREF = re.compile(rb"startxref[\x00\t\n\f\r ]+(\d+)")
+
+STRING_ESCAPES = {ord("n"): b"\n", ord("r"): b"\r", ord("t"): b"\t", ord("b"): b"\b", ord("f"): b"\f",
+    ord("("): b"(", ord(")"): b")", ord("\\"): b"\\"}
+
+# PDFDocEncoding differs from latin-1 in these code points
+PDF_DOC_ENCODING = {
+    0x18: "˘", 0x19: "ˇ", 0x1A: "ˆ", 0x1B: "˙", 0x1C: "˝", 0x1D: "˛", 0x1E: "˚", 0x1F: "˜",
+    0x80: "•", 0x81: "†", 0x82: "‡", 0x83: "…", 0x84: "—", 0x85: "–", 0x86: "ƒ", 0x87: "⁄",
+    0x88: "‹", 0x89: "›", 0x8A: "−", 0x8B: "‰", 0x8C: "„", 0x8D: "“", 0x8E: "”", 0x8F: "‘",
+    0x90: "’", 0x91: "‚", 0x92: "™", 0x93: "ﬁ", 0x94: "ﬂ", 0x95: "Ł", 0x96: "Œ", 0x97: "Š",
+    0x98: "Ÿ", 0x99: "Ž", 0x9A: "ı", 0x9B: "ł", 0x9C: "œ", 0x9D: "š", 0x9E: "ž", 0xA0: "€",
+}
+
+Reference = namedtuple("Reference", ["number", "generation"])
+
+
+class Name(str):
+    """A PDF name, kept with its leading slash."""
+
+
+class PdfTrailerError(Exception):
+    """The fast path can't handle this file, use a full PDF parser."""
+
+
+def read_pdf_info(path):
+    """
+    Read the document Info dictionary and page count of a PDF.
+
+    Returns:
+        tuple: (info, pages) where info maps author, creator, producer,
+            subject and title to strings (or None), or is None when the
+            document has no Info dictionary
+
+    Raises:
+        PdfTrailerError: Encrypted, damaged or otherwise unusual files
+    """
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise PdfTrailerError("empty file")
+    with data:
+        try:
+            return _Document(data).info_and_pages()
+        except PdfTrailerError:
+            raise
+        except (ValueError, IndexError, KeyError, TypeError, zlib.error) as error:
+            raise PdfTrailerError("{}: {}".format(type(error).__name__, error))
+
+
+def decode_text(value):
+    """Decode a PDF text string (UTF-16BE or UTF-8 with BOM, or PDFDocEncoding)."""
+    if value[:2] == b"\xfe\xff":
+        return value[2:].decode("utf-16-be", "replace")
+    if value[:3] == b"\xef\xbb\xbf":
+        return value[3:].decode("utf-8", "replace")
+    return "".join(PDF_DOC_ENCODING.get(byte, chr(byte)) for byte in value)
+
+
+class _Document:
+
+    def __init__(self, data):
+        self.data = data
+        self.sections = []
+        self.trailer = {}
+        self._object_streams = {}
+
+    def info_and_pages(self):
+        self._load_xref()
+        if "/Encrypt" in self.trailer:
+            raise PdfTrailerError("encrypted")
+        info = None
+        info_dict = self.resolve(self.trailer.get("/Info"))
+        if isinstance(info_dict, dict):
+            info = {}
+            for key, field in INFO_KEYS.items():
+                value = self.resolve(info_dict.get(key))
+                info[field] = decode_text(value) if isinstance(value, bytes) else None
+        root = self.resolve(self.trailer.get("/Root"))
+        pages = self.resolve(root.get("/Pages")) if isinstance(root, dict) else None
+        count = self.resolve(pages.get("/Count")) if isinstance(pages, dict) else None
+        if not isinstance(count, int):
+            raise PdfTrailerError("page tree root without /Count")
+        return info, count
+
+    def resolve(self, value):
+        seen = 0
+        while isinstance(value, Reference):
+            value = self.load_object(value.number)
+            seen += 1
+            if seen > 32:
+                raise PdfTrailerError("reference loop")
+        return value
+
+    # Cross reference sections
+
+    def _load_xref(self):
+        tail_start = max(0, len(self.data) - TAIL_SIZE)
+        tail = self.data[tail_start:]
+        matches = list(RE_STARTXREF.finditer(tail))
+        if not matches:
+            raise PdfTrailerError("startxref not found")
+        offset = int(matches[-1].group(1))
+        visited = set()
+        first = True
+        while offset is not None:
+            if offset in visited or offset >= len(self.data):
+                raise PdfTrailerError("bad xref offset {}".format(offset))
+            visited.add(offset)
+            trailer = self._load_section(offset)
+            if first:
+                self.trailer = trailer
+                first = False
+            if "/XRefStm" in trailer:
+                # Hybrid file: the stream lists the compressed objects of this update
+                self._load_section(trailer["/XRefStm"])
+            offset = trailer.get("/Prev")
+
+    def _load_section(self, offset):
+        pos = self._skip_whitespace(offset)
+        if self.data[pos:pos + 4] == b"xref":
+            return self._load_table(pos + 4)
+        return self._load_stream(offset)
+
+    def _load_table(self, pos):
+        subsections = []
+        while True:
+            pos = self._skip_whitespace(pos)
+            if self.data[pos:pos + 7] == b"trailer":
+                break
+            match = RE_SUBSECTION.match(self.data, pos)
+            if not match:
+                raise PdfTrailerError("bad xref table at {}".format(pos))
+            start, count = int(match.group(1)), int(match.group(2))
+            # Entries are 20 bytes each, they are only read when needed
+            subsections.append((start, count, match.end()))
+            pos = match.end() + 20 * count
+        self.sections.append(("table", subsections))
+        trailer, _ = _Parser(self.data, pos + 7).parse()
+        if not isinstance(trailer, dict):
+            raise PdfTrailerError("bad trailer")
+        return trailer
+
+    def _load_stream(self, offset):
+        stream, data = self._object_at(offset)
+        if not isinstance(stream, dict) or stream.get("/Type") != "/XRef" or data is None:
+            raise PdfTrailerError("bad xref stream at {}".format(offset))
+        widths = stream["/W"]
+        size = stream["/Size"]
+        index = stream.get("/Index", [0, size])
+        row = sum(widths)
+        subsections = []
+        position = 0
+        for i in range(0, len(index), 2):
+            subsections.append((index[i], index[i + 1], position))
+            position += index[i + 1] * row
+        self.sections.append(("stream", (subsections, widths, data)))
+        return stream
+
+    def _lookup(self, number):
+        """Return ("offset", pos) or ("compressed", (stream number, index)) for an object."""
+        for kind, section in self.sections:
+            if kind == "table":
+                for start, count, pos in section:
+                    if start <= number < start + count:
+                        entry = RE_XREF_ENTRY.match(self.data, pos + 20 * (number - start))
+                        if not entry:
+                            raise PdfTrailerError("bad xref entry for object {}".format(number))
+                        if entry.group(3) == b"n":
+                            return "offset", int(entry.group(1))
+                        break
+            else:
+                subsections, widths, data = section
+                row = sum(widths)
+                for start, count, pos in subsections:
+                    if start <= number < start + count:
+                        at = pos + row * (number - start)
+                        fields = []
+                        for width in widths:
+                            fields.append(int.from_bytes(data[at:at + width], "big"))
+                            at += width
+                        kind_field = fields[0] if widths[0] else 1
+                        if kind_field == 1:
+                            return "offset", fields[1]
+                        if kind_field == 2:
+                            return "compressed", (fields[1], fields[2])
+                        break
+        raise PdfTrailerError("object {} not in xref".format(number))
+
+    # Objects
+
+    def load_object(self, number):
+        kind, where = self._lookup(number)
+        if kind == "offset":
+            value, _ = self._object_at(where, number)
+            return value
+        stream_number, index = where
+        return self._object_stream(stream_number)[index]
+
+    def _object_at(self, offset, number=None):
+        """Parse the indirect object at offset, returns (value, stream data or None)."""
+        match = RE_OBJECT.match(self.data, offset)
+        if not match or (number is not None and int(match.group(1)) != number):
+            raise PdfTrailerError("object {} not found at {}".format(number, offset))
+        parser = _Parser(self.data, match.end())
+        value, pos = parser.parse()
+        pos = self._skip_whitespace(pos)
+        if isinstance(value, dict) and self.data[pos:pos + 6] == b"stream":
+            pos += 6
+            if self.data[pos:pos + 2] == b"\r\n":
+                pos += 2
+            elif self.data[pos:pos + 1] in (b"\n", b"\r"):
+                pos += 1
+            length = self.resolve(value["/Length"])
+            return value, _decode_stream(value, self.data[pos:pos + length])
+        return value, None
+
+    def _object_stream(self, number):
+        if number not in self._object_streams:
+            kind, offset = self._lookup(number)
+            if kind != "offset":
+                raise PdfTrailerError("object stream {} is compressed".format(number))
+            stream, data = self._object_at(offset, number)
+            first = stream["/First"]
+            header = data[:first].split()
+            objects = []
+            for i in range(0, 2 * stream["/N"], 2):
+                value, _ = _Parser(data, first + int(header[i + 1])).parse()
+                objects.append(value)
+            self._object_streams[number] = objects
+        return self._object_streams[number]
+
+    def _skip_whitespace(self, pos):
+        return RE_WHITESPACE.match(self.data, pos).end()
+
+
+class _Parser:
+
+    def __init__(self, data, pos):
+        self.data = data
+        self.pos = pos
+
+    def parse(self):
+        """Parse one object, returns (value, position after it)."""
+        value = self._value()
+        return value, self.pos
+
+    def _skip(self):
+        self.pos = RE_WHITESPACE.match(self.data, self.pos).end()
+
+    def _value(self):
+        self._skip()
+        data = self.data
+        char = data[self.pos:self.pos + 1]
+        if char == b"<":
+            if data[self.pos + 1:self.pos + 2] == b"<":
+                return self._dictionary()
+            return self._hex_string()
+        if char == b"[":
+            return self._array()
+        if char == b"(":
+            return self._literal_string()
+        if char == b"/":
+            match = RE_NAME.match(data, self.pos)
+            self.pos = match.end()
+            return Name(re.sub(rb"#([0-9A-Fa-f]{2})", lambda m: bytes([int(m.group(1), 16)]), match.group(0)).decode("latin-1"))
+        match = RE_REFERENCE.match(data, self.pos)
+        if match:
+            self.pos = match.end()
+            return Reference(int(match.group(1)), int(match.group(2)))
+        match = RE_NUMBER.match(data, self.pos)
+        if match:
+            self.pos = match.end()
+            text = match.group(0)
+            return float(text) if b"." in text else int(text)
+        match = RE_KEYWORD.match(data, self.pos)
+        if match:
+            self.pos = match.end()
+            keyword = match.group(0)
+            if keyword == b"true":
+                return True
+            if keyword == b"false":
+                return False
+            if keyword == b"null":
+                return None
+        raise PdfTrailerError("unexpected token at {}".format(self.pos))
+
+    def _dictionary(self):
+        self.pos += 2
+        result = {}
+        while True:
+            self._skip()
+            if self.data[self.pos:self.pos + 2] == b">>":
+                self.pos += 2
+                return result
+            key = self._value()
+            if not isinstance(key, Name):
+                raise PdfTrailerError("dictionary key is not a name at {}".format(self.pos))
+            result[key] = self._value()
+
+    def _array(self):
+        self.pos += 1
+        result = []
+        while True:
+            self._skip()
+            if self.data[self.pos:self.pos + 1] == b"]":
+                self.pos += 1
+                return result
+            result.append(self._value())
+
+    def _hex_string(self):
+        end = self.data.find(b">", self.pos)
+        if end < 0:
+            raise PdfTrailerError("unterminated hex string")
+        digits = re.sub(rb"[^0-9A-Fa-f]", b"", self.data[self.pos + 1:end])
+        if len(digits) % 2:
+            digits += b"0"
+        self.pos = end + 1
+        return bytes.fromhex(digits.decode("ascii"))
+
+    def _literal_string(self):
+        data = self.data
+        pos = self.pos + 1
+        depth = 1
+        out = bytearray()
+        while True:
+            char = data[pos]
+            pos += 1
+            if char == 0x5C: # backslash
+                escaped = data[pos]
+                pos += 1
+                if escaped in STRING_ESCAPES:
+                    out += STRING_ESCAPES[escaped]
+                elif 0x30 <= escaped <= 0x37:
+                    digits = bytes([escaped])
+                    while len(digits) < 3 and 0x30 <= data[pos] <= 0x37:
+                        digits += bytes([data[pos]])
+                        pos += 1
+                    out.append(int(digits, 8) & 0xFF)
+                elif escaped == 0x0D:
+                    # Line continuation
+                    if data[pos] == 0x0A:
+                        pos += 1
+                elif escaped != 0x0A:
+                    out.append(escaped)
+                continue
+            if char == 0x28:
+                depth += 1
+            elif char == 0x29:
+                depth -= 1
+                if depth == 0:
+                    break
+            out.append(char)
+        self.pos = pos
+        return bytes(out)
+
+
+def _decode_stream(stream, raw):
+    filters = stream.get("/Filter")
+    if filters is None:
+        filters = []
+    elif not isinstance(filters, list):
+        filters = [filters]
+    params = stream.get("/DecodeParms")
+    if isinstance(params, list):
+        params = params[0] if params else None
+    data = bytes(raw)
+    for name in filters:
+        if name != "/FlateDecode":
+            raise PdfTrailerError("unsupported filter {}".format(name))
+        data = zlib.decompress(data)
+    if isinstance(params, dict) and params.get("/Predictor", 1) > 1:
+        data = _unpredict(data, params)
+    return data
+
+
+def _unpredict(data, params):
+    predictor = params["/Predictor"]
+    if predictor < 10:
+        raise PdfTrailerError("unsupported predictor {}".format(predictor))
+    columns = params.get("/Columns", 1) * params.get("/Colors", 1) * params.get("/BitsPerComponent", 8) // 8
+    bpp = max(1, params.get("/Colors", 1) * params.get("/BitsPerComponent", 8) // 8)
+    out = bytearray()
+    previous = bytearray(columns)
+    for start in range(0, len(data), columns + 1):
+        kind = data[start]
+        row = bytearray(data[start + 1:start + 1 + columns])
+        for i in range(len(row)):
+            left = row[i - bpp] if i >= bpp else 0
+            up = previous[i]
+            if kind == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif kind == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif kind == 3:
+                row[i] = (row[i] + ((left + up) >> 1)) & 0xFF
+            elif kind == 4:
+                upper_left = previous[i - bpp] if i >= bpp else 0
+                estimate = left + up - upper_left
+                pa, pb, pc = abs(estimate - left), abs(estimate - up), abs(estimate - upper_left)
+                row[i] = (row[i] + (left if pa <= pb and pa <= pc else up if pb <= pc else upper_left)) & 0xFF
+            elif kind != 0:
+                raise PdfTrailerError("bad PNG predictor row type {}".format(kind))
+        out += row
+        previous = row
+    return bytes(out)
@@ -0,0 +1,151 @@
+# MIT License
+
+# Copyright (c) 2020 Lauri P. Laux Jr
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#
+# Perceptual hashing and near duplicate search for images.
+#
+# Every image is reduced to a 64 bit difference hash (dHash): a 9x8
+# grayscale thumbnail where each bit tells if a pixel is brighter than
+# its right neighbour. Re-encoded, resized or recompressed copies of a
+# photo end up with hashes only a few bits apart, so near duplicates are
+# the pairs within a small Hamming distance. Those pairs are found with a
+# BK-tree instead of comparing every image against every other one, and
+# grouped around the best image of each group.
+#
+
+import numpy as np
+
+from PIL import Image
+
+HASH_SIZE = 8
+
+
+def dhash(path):
+    """
+    Compute the 64 bit difference hash of an image.
+
+    Returns:
+        tuple: (hash, width, height) of the original image
+    """
+    with Image.open(path) as image:
+        width, height = image.size
+        # Let the JPEG decoder scale down while decoding, the hash only
+        # needs a few pixels
+        image.draft("L", (HASH_SIZE * 4, HASH_SIZE * 4))
+        small = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    value = int(np.packbits(bits).view(">u8")[0])
+    return value, width, height
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer hashes using the Hamming distance.
+
+    Each node keeps its children keyed by their distance to it, so a
+    search within a radius only descends into children whose distance is
+    within radius of the query distance (triangle inequality).
+    """
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, payload):
+        node = [value, payload, {}]
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value, radius):
+        """Return the payloads of every value within radius of the query."""
+        found = []
+        if self.root is None:
+            return found
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.append(node[1])
+            for child_distance, child in node[2].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+def find_near_duplicates(hashes, radius, order=None):
+    """
+    Group hashes that are within a Hamming radius of a representative.
+
+    Images are taken in order and each one not grouped yet becomes the
+    representative of a new group with every ungrouped image within
+    radius of it. Every member is so within radius of the first image of
+    its group, groups never chain A~B~C when A and C are further apart.
+
+    Args:
+        hashes (numpy.ndarray): Packed uint64 array with one hash per image
+        radius (int): Maximum number of differing bits to the representative
+        order (list): Indexes into hashes, best image first (default: as given)
+
+    Returns:
+        list: Lists of indexes into hashes, one per group of 2+ images,
+            representative first and the others in order
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    order = list(range(len(hashes))) if order is None else list(order)
+    rank = {index: position for position, index in enumerate(order)}
+    # Identical hashes are grouped by numpy, the tree only sees unique ones
+    unique, inverse = np.unique(hashes, return_inverse=True)
+    members = [[] for _ in range(len(unique))]
+    for index in order:
+        members[inverse[index]].append(index)
+
+    tree = BKTree()
+    for i, value in enumerate(unique.tolist()):
+        tree.add(value, i)
+
+    grouped = [False] * len(unique)
+    groups = []
+    for index in order:
+        leader = int(inverse[index])
+        if grouped[leader]:
+            continue
+        near = [i for i in tree.search(int(unique[leader]), radius) if not grouped[i]]
+        for i in near:
+            grouped[i] = True
+        group = sorted((member for i in near for member in members[i]), key=rank.__getitem__)
+        if len(group) > 1:
+            groups.append(group)
+    return groups
@@ -0,0 +1,161 @@
+# MIT License
+
+# Copyright (c) 2020 Lauri P. Laux Jr
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#
+# Persistent index of already classified photos.
+#
+# Opening and parsing the EXIF of every image is the slow part of a
+# photojunkclean run, while most of a photo library never changes. The
+# verdict of each file is kept in a SQLite database keyed by path and
+# validated against size, mtime and inode, so only new or modified
+# files need to be opened again. Verdicts also record the classifier
+# rules they were made with and are taken again when the rules change.
+# Perceptual hashes used by the dedupe mode are cached the same way in
+# their own table.
+#
+
+import os
+import sqlite3
+
+from platformdirs import user_cache_dir
+
+INDEX_FILE_NAME = "photojunkclean-index.sqlite"
+COMMIT_EVERY = 1000
+
+
+def default_index_path():
+    return os.path.join(user_cache_dir("tinytools"), INDEX_FILE_NAME)
+
+
+class PhotoIndex:
+    """
+    SQLite backed cache of per file verdicts.
+
+    A row is only trusted when the size, mtime and inode recorded for the
+    path still match the file on disk, and for verdicts when they were
+    made with the same rules; anything else counts as a miss.
+    """
+
+    def __init__(self, path=None, rebuild=False):
+        self.path = path or default_index_path()
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._db = sqlite3.connect(self.path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        if rebuild:
+            self._db.execute("DROP TABLE IF EXISTS photos")
+            self._db.execute("DROP TABLE IF EXISTS hashes")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS photos ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime INTEGER NOT NULL,"
+            " inode INTEGER NOT NULL,"
+            " camera INTEGER NOT NULL,"
+            " rules TEXT)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(photos)")}
+        if "rules" not in columns:
+            # Index of an older version, its verdicts are taken again once
+            self._db.execute("ALTER TABLE photos ADD COLUMN rules TEXT")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime INTEGER NOT NULL,"
+            " inode INTEGER NOT NULL,"
+            " hash INTEGER NOT NULL,"
+            " width INTEGER NOT NULL,"
+            " height INTEGER NOT NULL)"
+        )
+        self._db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def lookup(self, entry, rules=None):
+        """
+        Return the cached camera verdict for a ScanEntry, or None when the
+        file is unknown, changed since it was indexed or was classified
+        with other rules (any string identifying them).
+        """
+        row = self._lookup("SELECT size, mtime, inode, rules, camera FROM photos WHERE path = ?", entry, rules)
+        return None if row is None else bool(row[0])
+
+    def store(self, entry, camera, rules=None):
+        self._store("INSERT OR REPLACE INTO photos (path, size, mtime, inode, rules, camera) VALUES (?, ?, ?, ?, ?, ?)",
+            entry, rules, int(camera))
+
+    def lookup_hash(self, entry):
+        """
+        Return the cached (hash, width, height) of a ScanEntry, or None when
+        the file is unknown or changed since it was hashed.
+        """
+        row = self._lookup("SELECT size, mtime, inode, hash, width, height FROM hashes WHERE path = ?", entry)
+        if row is None:
+            return None
+        # SQLite integers are signed, hashes use the whole 64 bits
+        value, width, height = row
+        return value & 0xFFFFFFFFFFFFFFFF, width, height
+
+    def store_hash(self, entry, value, width, height):
+        if value >= 1 << 63:
+            value -= 1 << 64
+        self._store("INSERT OR REPLACE INTO hashes (path, size, mtime, inode, hash, width, height) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            entry, value, width, height)
+
+    def _lookup(self, query, entry, *key):
+        # key: more columns, after inode, that must match too
+        row = self._db.execute(query, (os.path.abspath(entry.path),)).fetchone()
+        valid = (entry.size, entry.mtime, entry.inode) + key
+        if row is None or row[:len(valid)] != valid:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[len(valid):]
+
+    def _store(self, query, entry, *values):
+        self._db.execute(query, (os.path.abspath(entry.path), entry.size, entry.mtime, entry.inode) + values)
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self._db.commit()
+            self._pending = 0
+
+    def commit(self):
+        """Write the pending verdicts now, for long running callers."""
+        if self._pending:
+            self._db.commit()
+            self._pending = 0
+
+    def close(self):
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
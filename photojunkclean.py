@@ -33,27 +33,85 @@
 #
 
 import click
+import hashlib
+import instrument
+import json
 import os
-import shutil
+import numpy as np
 
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 from exif import Image
+from folderscan import scan_files
+from folderwatch import FolderWatch
+from imageheaders import probe_dimensions, probe_exif
+from photohash import dhash, find_near_duplicates
+from moveengine import MoveEngine
+from photoindex import PhotoIndex, default_index_path
 from progress.bar import Bar
 from progress.spinner import Spinner
 
 IMAGE_MAX_SIZE = 512 # 512Kb
 FILE_NAME_KEYWORDS = {"screenshot"}
+CLASSIFY_CHUNK = 64 # images sent to a worker process at once
+HASH_DISTANCE = 6 # max hamming distance between near duplicate hashes
+IMAGE_TYPES = [".jpg", ".jpeg", ".png"]
+# Screen sizes of common phones, tablets and monitors, either orientation
+SCREEN_RESOLUTIONS = [
+    (640, 1136), (750, 1334), (828, 1792), (1125, 2436), (1170, 2532), (1179, 2556),
+    (1242, 2208), (1242, 2688), (1284, 2778), (1290, 2796), (1536, 2048), (1668, 2388),
+    (2048, 2732), (720, 1280), (720, 1600), (1080, 1920), (1080, 2220), (1080, 2280),
+    (1080, 2340), (1080, 2400), (1440, 2560), (1440, 2960), (1440, 3040), (1440, 3088),
+    (1440, 3120), (1440, 3200), (768, 1366), (900, 1440), (900, 1600), (1050, 1680),
+    (800, 1280), (1200, 1920), (1600, 2560), (1800, 2880), (2160, 3840),
+]
+# Tall phone screen shapes no camera shoots in, long side : short side
+SCREEN_RATIOS = [(18, 9), (18.5, 9), (19, 9), (19.5, 9), (20, 9), (21, 9)]
+RATIO_TOLERANCE = 0.005
+CLASSIFIER_VERSION = 2 # bump when checkCamera or checkImage decide differently
+
+ScreenTable = namedtuple("ScreenTable", ["resolutions", "ratios"])
 
 @click.command()
 @click.argument('folder')
 @click.option('--size', default=IMAGE_MAX_SIZE, 
     help='max file size to be consider junk in kbytes (default={}Kb)'.format(IMAGE_MAX_SIZE))
 @click.option('--move', default=None, help='folder to move junk')
-def findjunk(folder, size, move):
+@click.option('--index', default=None,
+    help='scan index file (default={})'.format(default_index_path()))
+@click.option('--rebuild-index', is_flag=True, help='discard the scan index and classify every file again')
+@click.option('--jobs', default=1, type=click.IntRange(min=1),
+    help='number of processes used to classify images (default=1)')
+@click.option('--dedupe', is_flag=True, help='look for near duplicate images instead of small junk ones')
+@click.option('--distance', default=HASH_DISTANCE,
+    help='max different bits between two duplicate image hashes (default={})'.format(HASH_DISTANCE))
+@click.option('--undo', is_flag=True, help='move the files of the last run back from the --move folder')
+@click.option('--undo-all', is_flag=True, help='like --undo, for every run kept in the move journal')
+@click.option('--watch', is_flag=True, help='keep running and clean new images as they arrive (Linux only)')
+@click.option('--screens', default=None, type=click.Path(exists=True, dir_okay=False),
+    help='JSON file with the "resolutions" ([[w, h], ...]) and "ratios" ([[long, short], ...]) of screenshots (default=built in table)')
+@click.option('--profile', default=None, metavar='PATH', help='write a JSON report of stage timings and per file latency')
+@click.option('--cprofile', is_flag=True, help='include cProfile data in the --profile report')
+def findjunk(folder, size, move, index, rebuild_index, jobs, dedupe, distance, undo, undo_all, watch, screens, profile, cprofile):
     """ FOLDER: folder to search for junk images """
-    move = move.strip()
+    with instrument.profiling("findjunk", profile, cprofile):
+        cleanJunk(folder, size, move, index, rebuild_index, jobs, dedupe, distance, undo or undo_all, watch, screens, undo_all)
+    if profile:
+        click.echo("Profile report saved: {}".format(profile))
+
+def cleanJunk(folder, size, move, index, rebuild_index, jobs, dedupe, distance, undo, watch, screens, undoAll=False):
+    move = move.strip() if move else move
     folder = folder.strip()
     click.echo("\nPhoto Junk Clean tool\n")
+    if undo:
+        if not move or not os.path.isdir(move):
+            click.echo("Invalid move folder: {}".format(move))
+            return
+        restored = undoMoves(move, undoAll)
+        click.echo("Restored {} files.".format(len(restored)))
+        return
     size += size * 1024
     if (move and not os.path.isdir(move)) or move == folder:
         click.echo("Invalid move folder: {}".format(move))
@@ -61,65 +119,263 @@ def findjunk(folder, size, move):
         return
     else:
         click.echo("Folder to move files: %s" % move)
+    if watch and dedupe:
+        click.echo("--watch only looks for junk images, it can't be used with --dedupe.")
+        return
+    screens = loadScreens(screens)
     if os.path.isdir(folder):
-        fileList = []
         click.echo("Analysing files...")
-        folders = findAllFolders(folder)
-        for folder in folders:
-            folderFileList = getFilesFromFolder(folder, size)
-            if len(folderFileList) > 0:
-                fileList = fileList + folderFileList
-        click.echo('\nFound %d files.' % len(fileList))
-        if move and len(fileList) > 0:
-            moveFiles(fileList, move)
-            click.echo("Done moving junk images. Check it!")
-        else:
-            for file in fileList:
-                click.echo('Junk file: {} ({} Kb)'.format(file["path"], int(file["size"] / 1024)))
+        with PhotoIndex(index, rebuild=rebuild_index) as photoIndex:
+            with instrument.stats().stage("analyse"):
+                if dedupe:
+                    fileList = getDuplicatesFromFolder(folder, distance, index=photoIndex, jobs=jobs)
+                else:
+                    fileList = getFilesFromFolder(folder, size, index=photoIndex, jobs=jobs, screens=screens)
+            instrument.stats().count("index_hits", photoIndex.hits)
+            instrument.stats().count("index_misses", photoIndex.misses)
+            instrument.stats().count("duplicates" if dedupe else "junk", len(fileList))
+            click.echo('\nIndex: {} hits, {} misses ({})'.format(photoIndex.hits, photoIndex.misses, photoIndex.path))
+            click.echo('\nFound %d files.' % len(fileList))
+            handleFiles(fileList, move, dedupe)
+            if watch:
+                watchFolder(folder, size, move, index=photoIndex, jobs=jobs, screens=screens)
     else:
         click.echo('Folder %s does not exists.' % folder)
 
-def getFilesFromFolder(folder, maxsize, types=[".jpg", ".jpeg", ".png"]):
+def handleFiles(fileList, move, dedupe=False):
+    if move and len(fileList) > 0:
+        moveFiles(fileList, move)
+        click.echo("Done moving junk images. Check it!")
+    else:
+        for file in fileList:
+            if dedupe:
+                click.echo('Duplicate file: {} (copy of {})'.format(file["path"], file["original"]))
+            else:
+                click.echo('Junk file: {} ({} Kb)'.format(file["path"], int(file["size"] / 1024)))
+
+def watchFolder(folder, maxsize, move, types=IMAGE_TYPES, index=None, jobs=1, screens=None):
+    """
+    Classify the images written or moved into folder as they arrive, in
+    debounced batches, until interrupted. Junk is moved (or listed) after
+    every batch and each batch is a run of the move journal: --undo
+    restores the last batch moved, --undo-all every batch still kept.
+    """
+    with FolderWatch(folder, types, exclude=[move]) as watch:
+        click.echo("\nWatching {} folders for new images (Ctrl+C to stop)...".format(watch.watched))
+        if watch.unwatched:
+            click.echo("inotify watch limit reached, {} folders are rescanned every minute instead.".format(len(watch.unwatched)))
+        try:
+            for batch in watch.batches():
+                candidates = (entry for entry in batch if isCandidate(entry, maxsize, screens))
+                fileList = [{"path": entry.path, "size": entry.size}
+                    for entry, camera in classifyImages(candidates, index, jobs, screens) if not camera]
+                if index is not None:
+                    index.commit()
+                click.echo("\n{} new images, {} junk.".format(len(batch), len(fileList)))
+                handleFiles(fileList, move)
+        except KeyboardInterrupt:
+            click.echo("\nStopped watching ({} queue overflows).".format(watch.overflows))
+
+def isCandidate(entry, maxsize, screens=None):
+    """
+    Small images get classified, and with a screenshot table images named
+    like screenshots or with the pixel size of a screen too. The size
+    comes from the image header, a few hundred bytes read for the big
+    files only.
+    """
+    if entry.size <= maxsize:
+        return True
+    if screens is None:
+        return False
+    if haveKeywords(entry.name):
+        return True
+    try:
+        return isScreenSize(probe_dimensions(entry.path), screens)
+    except OSError:
+        return False
+
+def loadScreens(path=None):
+    """ Screenshot size table from a JSON file, the built in one if path is None """
+    resolutions, ratios = SCREEN_RESOLUTIONS, SCREEN_RATIOS
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            table = json.load(f)
+        resolutions = table.get("resolutions", [])
+        ratios = table.get("ratios", [])
+    return ScreenTable(frozenset((min(w, h), max(w, h)) for w, h in resolutions),
+        tuple(max(a, b) / min(a, b) for a, b in ratios))
+
+def isScreenSize(size, screens):
+    """ True when an ImageSize matches a screen resolution or shape of the table """
+    if not size:
+        return False
+    short, long = sorted(size)
+    if (short, long) in screens.resolutions:
+        return True
+    ratio = long / short
+    return any(abs(ratio - screen) <= screen * RATIO_TOLERANCE for screen in screens.ratios)
+
+def getFilesFromFolder(folder, maxsize, types=IMAGE_TYPES, index=None, jobs=1, screens=None):
     fileList = []
+    iterations = 0
+    spinner = Spinner()
     if os.path.isdir(folder):
-        for root, _, files in os.walk(folder):
-            if len(files) == 0:
-                break
-            with Bar('-> {} '.format(folder), max=len(files)) as bar:
-                for file in files:
-                    bar.next()
-                    path = os.path.join(root, file)
-                    size = os.path.getsize(path)
-                    extension = os.path.splitext(file)[-1]
-                    if size <= maxsize and extension in types:
-                        if extension == ".png" or not fromCamera(path):
-                            fileList.append({"path": path, "size": size})
+        candidates = (entry for entry in instrument.timed_iter(scan_files(folder, types), "scan") if isCandidate(entry, maxsize, screens))
+        for entry, camera in classifyImages(candidates, index, jobs, screens):
+            iterations += 1
+            spinner.message = "-> {} - Candidates: {} - Junk: {} ".format(folder, iterations, len(fileList))
+            spinner.next()
+            if not camera:
+                fileList.append({"path": entry.path, "size": entry.size})
+        spinner.finish()
     return fileList
 
-def findAllFolders(folder):
-    folders = []
-    folders.append(folder)
+def getDuplicatesFromFolder(folder, distance, types=IMAGE_TYPES, index=None, jobs=1):
+    entries = []
+    hashes = []
+    spinner = Spinner()
     if os.path.isdir(folder):
-        for root, dirs, _ in os.walk(folder):
-            for folder in dirs:
-                fullpath = os.path.join(root, folder)
-                folders.append(fullpath)
-                #click.echo('-> added %s folder.' % fullpath)
-    return folders
+        for entry, result in hashImages(instrument.timed_iter(scan_files(folder, types), "scan"), index, jobs):
+            spinner.message = "-> {} - Hashed: {} ".format(folder, len(entries))
+            spinner.next()
+            if result is not None:
+                entries.append(entry)
+                hashes.append(result)
+        spinner.finish()
+    packed = np.fromiter((value for value, _, _ in hashes), dtype=np.uint64, count=len(hashes))
+    fileList = []
+    # Keep the copy with more pixels (then the bigger file), move the others
+    order = sorted(range(len(hashes)), key=lambda i: (hashes[i][1] * hashes[i][2], entries[i].size), reverse=True)
+    with instrument.stats().stage("group"):
+        groups = find_near_duplicates(packed, distance, order)
+    for group in groups:
+        original = entries[group[0]].path
+        for i in group[1:]:
+            fileList.append({"path": entries[i].path, "size": entries[i].size, "original": original})
+    return fileList
+
+def classifyImages(entries, index=None, jobs=1, screens=None):
+    """ Yield (entry, fromCamera) pairs in the same order the entries came in """
+    rules = classifierRules(screens)
+    lookup = lambda entry: knownVerdict(entry, index, rules)
+    store = lambda entry, camera, error: storeVerdict(entry, camera, error, index, rules)
+    work = partial(checkImage, screens=screens) if screens is not None else checkCamera
+    return processImages(entries, jobs, lookup, instrument.timed(work, "classify"), store)
+
+def hashImages(entries, index=None, jobs=1):
+    """ Yield (entry, (hash, width, height)) pairs, None for images that can't be read """
+    lookup = lambda entry: index.lookup_hash(entry) if index is not None else None
+    store = lambda entry, result, error: storeHash(entry, result, error, index)
+    return processImages(entries, jobs, lookup, instrument.timed(imageHash, "hash"), store)
+
+def processImages(entries, jobs, lookup, work, store):
+    """
+    Yield (entry, result) in input order. lookup(entry) answers from the
+    index when it can, the other entries go through work(path), which
+    returns (result, error), and are handed to store() afterwards.
+    """
+    if jobs <= 1:
+        for entry in entries:
+            result = lookup(entry)
+            if result is None:
+                result, error = instrument.unwrap(work(entry.path))
+                store(entry, result, error)
+            yield entry, result
+        return
+    # Chunks are submitted ahead while the oldest one is collected, so at most
+    # jobs * 2 chunks are held in memory and the output order never changes
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        window = deque()
+        for chunk in chunked(entries, CLASSIFY_CHUNK):
+            window.append(submitChunk(pool, chunk, lookup, work))
+            if len(window) >= jobs * 2:
+                yield from collectChunk(*window.popleft(), store)
+        while window:
+            yield from collectChunk(*window.popleft(), store)
+
+def chunked(entries, size):
+    chunk = []
+    for entry in entries:
+        chunk.append(entry)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def submitChunk(pool, chunk, lookup, work):
+    results = []
+    toCheck = []
+    for entry in chunk:
+        result = lookup(entry)
+        results.append(result)
+        if result is None:
+            toCheck.append(entry.path)
+    future = pool.submit(workChunk, work, toCheck) if toCheck else None
+    return chunk, results, future
+
+def collectChunk(chunk, results, future, store):
+    worked = iter(future.result()) if future else iter(())
+    for entry, result in zip(chunk, results):
+        if result is None:
+            result, error = instrument.unwrap(next(worked))
+            store(entry, result, error)
+        yield entry, result
+
+def workChunk(work, files):
+    return [work(file) for file in files]
+
+def classifierRules(screens=None):
+    """
+    Identify the rules a verdict is made with, the classifier version, the
+    screenshot table and file name keywords, so the index drops verdicts
+    of other rules
+    """
+    if screens is None:
+        return "camera-{}".format(CLASSIFIER_VERSION)
+    table = repr((sorted(screens.resolutions), sorted(screens.ratios), sorted(FILE_NAME_KEYWORDS))).encode("utf-8")
+    return "screens-{}-{}".format(CLASSIFIER_VERSION, hashlib.blake2b(table, digest_size=8).hexdigest())
+
+def knownVerdict(entry, index, rules=None):
+    """ PNGs never come from the camera, JPEGs may be in the scan index """
+    if os.path.splitext(entry.name)[-1] == ".png":
+        return False
+    if index is not None:
+        return index.lookup(entry, rules)
+    return None
+
+def storeVerdict(entry, camera, error, index, rules=None):
+    if error:
+        click.echo('\nError reading file: {} ({})'.format(entry.path, error))
+    elif index is not None:
+        index.store(entry, camera, rules)
+
+def storeHash(entry, result, error, index):
+    if error:
+        click.echo('\nError reading file: {} ({})'.format(entry.path, error))
+    elif index is not None:
+        index.store_hash(entry, *result)
 
 def moveFiles(fileList, toFolder):
-    with Bar('Moving files', max=len(fileList)) as bar:
-        for file in fileList:
-            _, moveFileName = os.path.split(file["path"])
-            newFile = os.path.join(toFolder, moveFileName)
-            suffix = 0
-            while os.path.isfile(newFile):
-                _, name = os.path.split(newFile)
-                name, ext = os.path.splitext(name)
-                suffix += 1
-                newFile = os.path.join(toFolder, "{}-({}){}".format(name, suffix, ext))
-            shutil.move(file["path"], newFile)
-            bar.next()
+    engine = MoveEngine(toFolder)
+    with instrument.stats().stage("move"):
+        if engine.pending() > 0:
+            with Bar('Resuming interrupted move', max=engine.pending()) as bar:
+                engine.resume(progress=bar.next)
+        with Bar('Moving files', max=len(fileList)) as bar:
+            moved = engine.move([file["path"] for file in fileList], progress=bar.next)
+    instrument.stats().count("moved", len(moved))
+    instrument.stats().count("move_errors", len(engine.errors))
+    for path, error in engine.errors:
+        click.echo('Error moving file: {} ({})'.format(path, error))
+
+def undoMoves(toFolder, allRuns=False):
+    engine = MoveEngine(toFolder)
+    with Bar('Restoring files', max=engine.undoable(allRuns)) as bar:
+        restored = engine.undo(progress=bar.next, all_runs=allRuns)
+    for path, error in engine.errors:
+        click.echo('Error restoring file: {} ({})'.format(path, error))
+    return restored
 
 def haveKeywords(fileName):
     for keyword in FILE_NAME_KEYWORDS:
@@ -127,15 +383,45 @@ def haveKeywords(fileName):
             return True
     return False
 
-def fromCamera(file):
-    hasExif = False
-    with open(file, 'rb') as image_file:
-        try:
+def imageHash(file):
+    """ Return ((hash, width, height), error) like checkCamera() """
+    try:
+        return dhash(file), None
+    except Exception as error:
+        return None, "{}: {}".format(type(error).__name__, error)
+
+def checkImage(file, screens):
+    """
+    checkCamera() that first rules out screenshots: an image named like a
+    screenshot or with the size of a screen, and no camera make in its
+    EXIF (iOS screenshots do carry EXIF), does not come from the camera.
+    """
+    try:
+        if haveKeywords(os.path.basename(file)) or isScreenSize(probe_dimensions(file), screens):
+            probe = probe_exif(file)
+            if probe is not None and not probe.make:
+                return False, None
+    except Exception as error:
+        return False, "{}: {}".format(type(error).__name__, error)
+    return checkCamera(file)
+
+def checkCamera(file):
+    """ Return (hasExif, error) so worker processes can report failures back """
+    try:
+        probe = probe_exif(file)
+        if probe is not None:
+            return probe.has_exif, None
+        # Probe was inconclusive, let the exif module parse the whole file
+        with open(file, 'rb') as image_file:
             analyseimg = Image(image_file)
-            #click.echo(dir(analyseimg))
-            hasExif = analyseimg.has_exif
-        except:
-            click.echo('\nError reading file: {}'.format(file))
+            return analyseimg.has_exif, None
+    except Exception as error:
+        return False, "{}: {}".format(type(error).__name__, error)
+
+def fromCamera(file):
+    hasExif, error = checkCamera(file)
+    if error:
+        click.echo('\nError reading file: {} ({})'.format(file, error))
     return hasExif
 
 if __name__=="__main__":
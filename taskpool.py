@@ -0,0 +1,174 @@
+# MIT License
+
+# Copyright (c) 2020 Lauri P. Laux Jr
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#
+# Supervised process pool for per file work that may hang or blow up.
+#
+# concurrent.futures can't stop a single task that never returns, and a
+# worker killed by the OOM killer breaks the whole executor. Here every
+# worker is a plain process fed through its own pipe, so the parent
+# always knows which item a worker is busy with: a worker past its
+# deadline is terminated and replaced, a worker that dies is replaced,
+# and in both cases only that one item is reported as failed.
+#
+
+import os
+import time
+
+from collections import namedtuple
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, memory caps are skipped there
+    resource = None
+
+TIMEOUT = "timeout"
+MEMORY = "memory"
+CRASHED = "crashed"
+ERROR = "error"
+
+TaskResult = namedtuple("TaskResult", ["item", "value", "failure", "message"])
+
+
+class TaskPool:
+    """
+    Run function(item) on worker processes, yielding results as they finish.
+
+    Args:
+        function (callable): Picklable (module level) function of one item
+        jobs (int): Number of worker processes
+        timeout (float): Seconds an item may take before its worker is
+            killed, None for no limit
+        max_memory (int): Address space limit of each worker in bytes,
+            None for no limit (POSIX only)
+    """
+
+    def __init__(self, function, jobs=None, timeout=None, max_memory=None):
+        self.function = function
+        self.jobs = jobs or os.cpu_count() or 1
+        self.timeout = timeout
+        self.max_memory = max_memory
+
+    def run(self, items):
+        """
+        Yield a TaskResult per item in completion order. failure is None on
+        success, otherwise one of TIMEOUT, MEMORY, CRASHED or ERROR.
+        """
+        items = iter(items)
+        idle = [_Worker(self.function, self.max_memory) for _ in range(self.jobs)]
+        busy = {}
+        exhausted = False
+        try:
+            while True:
+                while idle and not exhausted:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    worker = idle.pop()
+                    worker.start(item, self.timeout)
+                    busy[worker.connection] = worker
+                if not busy:
+                    break
+                ready = wait(list(busy) + [w.process.sentinel for w in busy.values()], self._next_deadline(busy))
+                now = time.monotonic()
+                for connection, worker in list(busy.items()):
+                    result = None
+                    if connection in ready or connection.poll():
+                        try:
+                            ok, value = connection.recv()
+                            result = TaskResult(worker.item, value, None, None) if ok else TaskResult(worker.item, None, *value)
+                        except (EOFError, OSError):
+                            result = TaskResult(worker.item, None, CRASHED, "worker exited")
+                    elif not worker.process.is_alive():
+                        result = TaskResult(worker.item, None, CRASHED, "worker exited with code {}".format(worker.process.exitcode))
+                    elif worker.deadline is not None and now >= worker.deadline:
+                        result = TaskResult(worker.item, None, TIMEOUT, "took more than {}s".format(self.timeout))
+                    if result is None:
+                        continue
+                    del busy[connection]
+                    if result.failure in (CRASHED, TIMEOUT):
+                        worker.kill()
+                        worker = _Worker(self.function, self.max_memory)
+                    idle.append(worker)
+                    yield result
+        finally:
+            for worker in idle + list(busy.values()):
+                worker.stop()
+
+    def _next_deadline(self, busy):
+        deadlines = [w.deadline for w in busy.values() if w.deadline is not None]
+        if not deadlines:
+            return None
+        return max(0, min(deadlines) - time.monotonic())
+
+
+class _Worker:
+
+    def __init__(self, function, max_memory):
+        self.connection, child = Pipe()
+        self.process = Process(target=_work, args=(function, child, max_memory), daemon=True)
+        self.process.start()
+        child.close()
+        self.item = None
+        self.deadline = None
+
+    def start(self, item, timeout):
+        self.item = item
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.connection.send(item)
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+
+def _work(function, connection, max_memory):
+    if max_memory and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+    while True:
+        try:
+            item = connection.recv()
+        except EOFError:
+            break
+        if item is None:
+            break
+        try:
+            connection.send((True, function(item)))
+        except MemoryError:
+            connection.send((False, (MEMORY, "exceeded {} bytes".format(max_memory))))
+        except Exception as error:
+            connection.send((False, (ERROR, "{}: {}".format(type(error).__name__, error))))